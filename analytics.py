@@ -0,0 +1,152 @@
+"""Vectorized risk analytics over the current holdings: volatility, beta, VaR and correlation."""
+import threading
+from collections import OrderedDict, namedtuple
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from history import NIFTY100
+
+TRADING_DAYS = 252
+
+# Aligned daily simple returns: dates (T), tickers (N), returns (T x N), benchmark (T, NaN if unavailable)
+ReturnMatrix = namedtuple("ReturnMatrix", ["dates", "tickers", "returns", "benchmark"])
+
+_RETURNS_CACHE = OrderedDict()
+_RETURNS_CACHE_SIZE = 8
+# Sessions run on separate threads; the matrix is built outside the lock so lookups never wait on it
+_returns_lock = threading.Lock()
+
+
+def return_matrix(store, tickers, start=None, end=None, benchmark=NIFTY100):
+    """Daily returns for tickers on days where every one of them traded, cached per store version and range."""
+    key = (store.signature(), tuple(tickers), str(start), str(end), benchmark)
+    with _returns_lock:
+        matrix = _RETURNS_CACHE.get(key)
+        if matrix is not None:
+            _RETURNS_CACHE.move_to_end(key)
+    if matrix is not None:
+        metrics.count("returns_cache_hits")
+        return matrix
+    metrics.count("returns_cache_misses")
+    closes = store.frame(list(tickers) + [benchmark], start, end).ffill()
+    if benchmark not in closes:
+        closes[benchmark] = np.nan
+    prices = closes.reindex(columns=list(tickers)).to_numpy(dtype=np.float64)
+    bench = closes[benchmark].to_numpy(dtype=np.float64)
+    if len(prices) < 2:
+        returns, bench_returns, dates = np.empty((0, len(tickers))), np.empty(0), closes.index[:0]
+    else:
+        returns = prices[1:] / prices[:-1] - 1
+        bench_returns = bench[1:] / bench[:-1] - 1
+        complete = ~np.isnan(returns).any(axis=1)
+        returns, bench_returns, dates = returns[complete], bench_returns[complete], closes.index[1:][complete]
+    matrix = ReturnMatrix(dates, list(tickers), returns, bench_returns)
+    with _returns_lock:
+        _RETURNS_CACHE[key] = matrix
+        _RETURNS_CACHE.move_to_end(key)
+        while len(_RETURNS_CACHE) > _RETURNS_CACHE_SIZE:
+            _RETURNS_CACHE.popitem(last=False)
+    return matrix
+
+
+def rolling_volatility(returns, window=20, annualize=True):
+    """Rolling standard deviation of each column over window days, via cumulative sums (T-window+1 x N)."""
+    returns = np.atleast_2d(returns.T).T
+    if len(returns) < window:
+        return np.empty((0, returns.shape[1]))
+    zero = np.zeros((1, returns.shape[1]))
+    s1 = np.vstack([zero, np.cumsum(returns, axis=0)])
+    s2 = np.vstack([zero, np.cumsum(returns ** 2, axis=0)])
+    total = s1[window:] - s1[:-window]
+    total_sq = s2[window:] - s2[:-window]
+    variance = np.maximum((total_sq - total ** 2 / window) / (window - 1), 0.0)
+    vol = np.sqrt(variance)
+    return vol * np.sqrt(TRADING_DAYS) if annualize else vol
+
+
+def betas(returns, benchmark):
+    """Beta of each column against the benchmark return series, over days with benchmark data."""
+    mask = ~np.isnan(benchmark)
+    if mask.sum() < 2:
+        return np.full(returns.shape[1], np.nan)
+    b = benchmark[mask] - benchmark[mask].mean()
+    r = returns[mask] - returns[mask].mean(axis=0)
+    variance = b @ b
+    return (r.T @ b) / variance if variance > 0 else np.full(returns.shape[1], np.nan)
+
+
+def covariance(returns):
+    """Sample covariance matrix of the columns (N x N)."""
+    r = returns - returns.mean(axis=0)
+    return (r.T @ r) / max(len(returns) - 1, 1)
+
+
+def correlation(cov):
+    """Correlation matrix from a covariance matrix."""
+    std = np.sqrt(np.diag(cov))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = cov / np.outer(std, std)
+    np.fill_diagonal(corr, 1.0)
+    return corr
+
+
+def historical_var(portfolio_returns, confidence=0.95):
+    """One-day VaR as a positive loss fraction: the (1 - confidence) quantile of observed returns."""
+    if not len(portfolio_returns):
+        return np.nan
+    return float(-np.quantile(portfolio_returns, 1 - confidence))
+
+
+def parametric_var(mean, std, confidence=0.95):
+    """One-day variance-covariance VaR as a positive loss fraction, assuming normal returns."""
+    return float(-(mean + NormalDist().inv_cdf(1 - confidence) * std))
+
+
+@metrics.timed("analytics.risk_report")
+def risk_report(current, store, start=None, end=None, confidence=0.95, window=20):
+    """Per-holding and portfolio risk for the current book over a date range.
+
+    Weights are current market values of the holdings with stored history. VaR is reported both as a fraction of
+    the book and in rupees. Returns None when there is not enough history.
+    """
+    if current.empty:
+        return None
+    values = current.frame().groupby("stock_name", sort=False)["current_value"].sum()
+    # Holdings without any stored history cannot be measured and are left out of the weights
+    values = values[[ticker in store.manifest for ticker in values.index]]
+    if values.empty:
+        return None
+    matrix = return_matrix(store, list(values.index), start, end)
+    if len(matrix.returns) < 2:
+        return None
+    total_value = float(values.sum())
+    weights = values.to_numpy(dtype=np.float64) / total_value if total_value > 0 else np.zeros(len(values))
+    returns = matrix.returns
+    cov = covariance(returns)
+    holding_betas = betas(returns, matrix.benchmark)
+    rolling = rolling_volatility(returns, window)
+    portfolio_returns = returns @ weights
+    portfolio_std = float(np.sqrt(weights @ cov @ weights))
+    hist_var = historical_var(portfolio_returns, confidence)
+    param_var = parametric_var(float(portfolio_returns.mean()), portfolio_std, confidence)
+    holdings = pd.DataFrame({
+        "weight": weights,
+        "volatility": np.sqrt(np.diag(cov) * TRADING_DAYS),
+        "rolling_volatility": rolling[-1] if len(rolling) else np.nan,
+        "beta": holding_betas,
+    }, index=matrix.tickers)
+    return {
+        "days": len(returns),
+        "holdings": holdings,
+        "covariance": pd.DataFrame(cov, index=matrix.tickers, columns=matrix.tickers),
+        "correlation": pd.DataFrame(correlation(cov), index=matrix.tickers, columns=matrix.tickers),
+        "volatility": portfolio_std * np.sqrt(TRADING_DAYS),
+        "beta": float(weights @ holding_betas),
+        "historical_var": hist_var,
+        "parametric_var": param_var,
+        "historical_var_value": hist_var * total_value,
+        "parametric_var_value": param_var * total_value,
+    }
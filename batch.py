@@ -0,0 +1,140 @@
+"""Headless batch jobs for portfolio books, e.g. end-of-day mark-to-market.
+
+Usage:
+    python -m batch revalue BOOK_DIR [BOOK_DIR ...] [--workers N] [--price-file PATH] [--report PATH]
+
+Each BOOK_DIR holds one book's ledger (or legacy CSVs). Prices for the union
+of all books' tickers are fetched once; books are then loaded, repriced and
+saved in parallel worker processes. Nothing here imports Streamlit.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from holdings import Portfolio
+from ledger import LEGACY_CURRENT_CSV, Ledger, import_legacy_csvs, read_legacy_csv
+from prices import PriceEngine, YFinanceProvider, FilePriceProvider
+
+REPORT_COLUMNS = [
+    "book", "holdings", "repriced", "unpriced", "current_value", "investment",
+    "profit_loss", "percent_profit_loss", "booked_profit_loss", "error",
+]
+
+
+def _open_book(directory):
+    ledger = Ledger(directory)
+    problems = import_legacy_csvs(ledger)
+    current, sold = ledger.load()
+    return ledger, current, sold, problems
+
+
+def book_tickers(directory):
+    """Tickers one book may hold, read without importing legacy CSVs or loading it; bad books are reported by revalue_book."""
+    try:
+        ledger = Ledger(directory)
+        if ledger.exists():
+            return ledger.tickers()
+        current, _ = read_legacy_csv(os.path.join(directory, LEGACY_CURRENT_CSV), Portfolio)
+        return current.tickers()
+    except Exception:
+        return []
+
+
+def revalue_book(directory, prices):
+    """Record one price mark for a book from {ticker: price} and return its summary row."""
+    row = {"book": directory}
+    if not os.path.isdir(directory):
+        # A mistyped path must fail the run, not report an empty book worth nothing
+        row["error"] = "no such book directory"
+        return row
+    try:
+        ledger, current, sold, problems = _open_book(directory)
+        tickers = current.tickers()
+        marks = {ticker: prices[ticker] for ticker in tickers if ticker in prices}
+        if marks:
+            ledger.record(current, sold, "reprice", prices=marks)
+        totals = current.totals()
+        row.update({
+            "holdings": len(tickers),
+            "repriced": len(marks),
+            "unpriced": " ".join(sorted(set(tickers) - set(marks))),
+            "current_value": round(totals["current_value"], 2),
+            "investment": round(totals["investment"], 2),
+            "profit_loss": round(totals["profit_loss"], 2),
+            "percent_profit_loss": round(totals["percent_profit_loss"], 2),
+            "booked_profit_loss": round(sold.totals()["booked_profit_loss"], 2),
+            "error": "; ".join(problems),
+        })
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    return row
+
+
+def _map(function, items, workers, *args):
+    if workers <= 1 or len(items) <= 1:
+        return [function(item, *args) for item in items]
+    with ProcessPoolExecutor(max_workers=min(workers, len(items))) as pool:
+        return list(pool.map(function, items, *[[arg] * len(items) for arg in args]))
+
+
+def revalue(books, workers=None, price_file=None, timeout=30.0):
+    """Mark every book to market: one concurrent price refresh for all tickers, then one process per book."""
+    workers = workers or os.cpu_count() or 1
+    tickers = sorted({ticker for held in _map(book_tickers, books, workers) for ticker in held})
+    provider = FilePriceProvider(price_file) if price_file else YFinanceProvider()
+    result = PriceEngine([provider]).refresh(tickers, timeout=timeout)
+    prices = {ticker: quote.price for ticker, quote in result.quotes.items()}
+    rows = _map(revalue_book, books, workers, prices)
+    return rows, result.failures
+
+
+def write_report(rows, path):
+    """Write summary rows as JSON (for a .json path) or CSV."""
+    if path.endswith(".json"):
+        with open(path, "w") as f:
+            json.dump(rows, f, indent=2)
+        return
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def print_report(rows, failures, out=sys.stdout):
+    out.write(f"{'Book':<30} {'Holdings':>8} {'Repriced':>8} {'Value (₹)':>16} {'P&L (₹)':>14} {'P&L %':>8}\n")
+    for row in rows:
+        if "current_value" not in row:
+            out.write(f"{row['book']:<30} FAILED: {row['error']}\n")
+            continue
+        out.write(f"{row['book']:<30} {row['holdings']:>8} {row['repriced']:>8} {row['current_value']:>16,.2f} "
+                  f"{row['profit_loss']:>14,.2f} {row['percent_profit_loss']:>7.2f}%\n")
+    total_value = sum(row.get("current_value", 0) for row in rows)
+    total_profit_loss = sum(row.get("profit_loss", 0) for row in rows)
+    out.write(f"{len(rows)} book(s), total value ₹{total_value:,.2f}, total unrealized P&L ₹{total_profit_loss:,.2f}\n")
+    for ticker, reason in sorted(failures.items()):
+        out.write(f"No price for {ticker}: {reason}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m batch", description=__doc__.split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    revalue_parser = commands.add_parser("revalue", help="Mark books to market and print a summary report.")
+    revalue_parser.add_argument("books", nargs="+", help="Book directories holding a ledger or legacy CSVs.")
+    revalue_parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count).")
+    revalue_parser.add_argument("--price-file", help="Price from a local JSON/CSV file instead of yfinance.")
+    revalue_parser.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for the price refresh.")
+    revalue_parser.add_argument("--report", help="Also write the summary to this .csv or .json file.")
+    args = parser.parse_args(argv)
+
+    rows, failures = revalue(args.books, args.workers, args.price_file, args.timeout)
+    print_report(rows, failures)
+    if args.report:
+        write_report(rows, args.report)
+    return 1 if any(row.get("error") and "current_value" not in row for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
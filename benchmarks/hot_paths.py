@@ -0,0 +1,252 @@
+"""Hot-path benchmark: time and peak memory of load, save, reprice, sell, chart and app rerun on synthetic books.
+
+Usage:
+    python benchmarks/hot_paths.py [--sizes 10,1000,10000,100000] [--repeat N] [--paths load,save,...]
+                                   [--json PATH] [--thresholds PATH] [--record-thresholds]
+
+Books are generated from a fixed seed and priced by a deterministic fake
+provider, so runs are comparable. Each timing is the median of --repeat runs;
+peak memory comes from one extra run under tracemalloc. With a thresholds file
+(benchmarks/thresholds.json by default) the script exits non-zero when any
+median exceeds its ceiling; --record-thresholds rewrites the file from this
+run with headroom. The rerun path drives the Streamlit app through AppTest and
+is skipped on Streamlit versions without streamlit.testing.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from charts import _PNG_CACHE, chart_data, render_png  # noqa: E402
+from holdings import FIFO, Portfolio, SoldPortfolio  # noqa: E402
+from ledger import Ledger  # noqa: E402
+from prices import PriceEngine, PriceProvider  # noqa: E402
+
+SIZES = [10, 1000, 10000, 100000]
+PATHS = ["load", "save", "reprice", "sell", "chart", "rerun"]
+THRESHOLDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thresholds.json")
+# Recorded ceilings are this many times the measured median, to absorb machine noise
+HEADROOM = 3.0
+# Floor for recorded ceilings: sub-millisecond paths would otherwise fail on scheduler jitter
+MIN_THRESHOLD_MS = 5.0
+# Events replayed on top of the snapshot by the load path, as after a day of trading
+TAIL_EVENTS = 100
+SELLS = 100
+RERUNS_MAX_ROWS = 10000
+
+
+class FakePriceProvider(PriceProvider):
+    """Deterministic prices: each call moves every ticker by a seeded random step around its base price."""
+    name = "fake"
+
+    def __init__(self, base_prices, seed=0):
+        self.base_prices = base_prices
+        self.rng = np.random.default_rng(seed)
+
+    def fetch_prices(self, tickers):
+        steps = 1 + self.rng.normal(0, 0.01, len(tickers))
+        return {ticker: round(self.base_prices[ticker] * step, 2) for ticker, step in zip(tickers, steps)}
+
+
+def synthetic_book(rows, seed=0):
+    """(current, sold, base prices) with rows purchase lots spread over up to 500 tickers."""
+    rng = np.random.default_rng(seed)
+    tickers = np.array([f"T{i:04d}" for i in range(min(rows, 500))], dtype=object)
+    base = rng.uniform(50, 5000, len(tickers)).round(2)
+    pick = rng.integers(0, len(tickers), rows)
+    current = Portfolio.from_columns({
+        "stock_name": tickers[pick],
+        "stock_pur_price": (base[pick] * rng.uniform(0.7, 1.3, rows)).round(2),
+        "stock_cur_price": base[pick],
+        "quantity": rng.integers(1, 500, rows),
+    })
+    sold_rows = max(rows // 10, 1)
+    sold_pick = rng.integers(0, len(tickers), sold_rows)
+    sold = SoldPortfolio.from_columns({
+        "stock_name": tickers[sold_pick],
+        "stock_pur_price": base[sold_pick],
+        "stock_sold_price": (base[sold_pick] * rng.uniform(0.8, 1.2, sold_rows)).round(2),
+        "quantity": rng.integers(1, 100, sold_rows),
+    })
+    return current, sold, dict(zip(tickers, base.tolist()))
+
+
+def _write_book(directory, current, sold, prices):
+    """Snapshot the book plus a tail of price marks, as the app would leave it."""
+    ledger = Ledger(directory, snapshot_every=TAIL_EVENTS + 1)
+    ledger.write_snapshot(current, sold)
+    tickers = list(prices)
+    for i in range(TAIL_EVENTS):
+        ticker = tickers[i % len(tickers)]
+        ledger.record(current, sold, "reprice", prices={ticker: prices[ticker]})
+
+
+def bench_load(rows, workdir):
+    """Prepared book directory and a callable that loads it from snapshot plus tail."""
+    current, sold, prices = synthetic_book(rows)
+    directory = os.path.join(workdir, f"load-{rows}")
+    os.makedirs(directory, exist_ok=True)
+    _write_book(directory, current, sold, prices)
+    return lambda: Ledger(directory).load()
+
+
+def bench_save(rows, workdir):
+    current, sold, _ = synthetic_book(rows)
+    ledger = Ledger(os.path.join(workdir, f"save-{rows}"))
+    os.makedirs(ledger.directory, exist_ok=True)
+    return lambda: ledger.write_snapshot(current, sold)
+
+
+def bench_reprice(rows, workdir):
+    """Fetch every ticker through the engine, mark the book and rebuild the P&L frame and totals."""
+    current, _, prices = synthetic_book(rows)
+    engine = PriceEngine([FakePriceProvider(prices)])
+    tickers = current.tickers()
+
+    def run():
+        current.reprice(engine.get_prices(tickers, force=True))
+        current.frame()
+        current.totals()
+    return run
+
+
+def bench_sell(rows, workdir):
+    """SELLS FIFO sales of part of a lot each, on a fresh copy of the book per run."""
+    current, _, _ = synthetic_book(rows)
+    tickers = current.tickers()[:SELLS]
+    columns = current.to_columns()
+
+    def run():
+        book, sold = Portfolio.from_columns(columns), SoldPortfolio()
+        for ticker in tickers:
+            sold.add(**book.sell(ticker, 1, 100.0, FIFO))
+        book.frame()
+    return run
+
+
+def bench_chart(rows, workdir):
+    """Aggregate chart data and render a PNG, bypassing the rendered-image cache."""
+    import pandas as pd
+    current, sold, _ = synthetic_book(rows)
+    nifty = pd.DataFrame({"date": pd.to_datetime(["2025-04-02", "2025-04-17"]), "price": [23713.80, 24418.35]})
+
+    def run():
+        _PNG_CACHE.clear()
+        render_png(chart_data(current.frame(), sold.frame(), nifty))
+    return run
+
+
+def bench_rerun(rows, workdir):
+    """A widget-only rerun of the whole app through AppTest, after one cold run; None if unsupported."""
+    if rows > RERUNS_MAX_ROWS:
+        return None
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        return None
+    current, sold, prices = synthetic_book(rows)
+    directory = os.path.join(workdir, f"rerun-{rows}")
+    os.makedirs(directory, exist_ok=True)
+    _write_book(directory, current, sold, prices)
+    price_file = os.path.join(directory, "prices.json")
+    with open(price_file, "w") as f:
+        json.dump(prices, f)
+    os.environ["PORTFOLIO_DATA_DIR"] = directory
+    os.environ["PORTFOLIO_PRICE_FILE"] = price_file
+    app = AppTest.from_file(os.path.join(REPO_ROOT, "portfolio.py"), default_timeout=600)
+    app.run()
+    if app.exception:
+        raise RuntimeError(app.exception[0].value)
+    return app.run
+
+
+BENCHES = {
+    "load": bench_load,
+    "save": bench_save,
+    "reprice": bench_reprice,
+    "sell": bench_sell,
+    "chart": bench_chart,
+    "rerun": bench_rerun,
+}
+
+
+def measure(run, repeat):
+    """(median ms, peak traced MiB) of a callable."""
+    run()  # warm-up: imports, first figure, lazily built caches
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak / 2 ** 20
+
+
+def load_thresholds(path):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="Comma-separated book sizes in rows.")
+    parser.add_argument("--paths", default=",".join(PATHS), help=f"Comma-separated subset of {', '.join(PATHS)}.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per path and size (median is reported).")
+    parser.add_argument("--json", help="Write results to this file for tracking over time.")
+    parser.add_argument("--thresholds", default=THRESHOLDS_FILE, help="JSON of {\"path@rows\": max ms}.")
+    parser.add_argument("--record-thresholds", action="store_true",
+                        help=f"Write this run's medians x{HEADROOM:g} to the thresholds file instead of checking.")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    paths = args.paths.split(",")
+    thresholds = {} if args.record_thresholds else load_thresholds(args.thresholds)
+    results, regressions = {}, []
+    print(f"{'Path':<8} {'Rows':>7} {'Median (ms)':>12} {'Peak (MiB)':>11} {'Limit (ms)':>11}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for path in paths:
+            for rows in sizes:
+                run = BENCHES[path](rows, workdir)
+                key = f"{path}@{rows}"
+                if run is None:
+                    print(f"{path:<8} {rows:>7} {'skipped':>12}")
+                    continue
+                median, peak = measure(run, args.repeat)
+                limit = thresholds.get(key)
+                results[key] = {"median_ms": round(median, 2), "peak_mib": round(peak, 2)}
+                flag = ""
+                if limit is not None and median > limit:
+                    regressions.append(key)
+                    flag = "  REGRESSION"
+                print(f"{path:<8} {rows:>7} {median:>12.2f} {peak:>11.2f} {limit if limit is not None else '-':>11}{flag}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.record_thresholds:
+        recorded = load_thresholds(args.thresholds)
+        recorded.update({key: round(max(result["median_ms"] * HEADROOM, MIN_THRESHOLD_MS), 1)
+                         for key, result in results.items()})
+        with open(args.thresholds, "w") as f:
+            json.dump(dict(sorted(recorded.items())), f, indent=2)
+            f.write("\n")
+    if regressions:
+        print(f"Slower than threshold: {', '.join(regressions)}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
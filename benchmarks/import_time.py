@@ -0,0 +1,92 @@
+"""Cold-start import benchmark: time each module in a fresh interpreter and check heavy imports stay lazy.
+
+Usage:
+    python benchmarks/import_time.py [--repeat N] [--json PATH]
+
+Exits non-zero if a headless module pulls in a dependency that should only
+load on first use (yfinance, matplotlib, streamlit).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["metrics", "storage", "holdings", "snapshot", "ledger", "prices", "feed", "history", "analytics", "scenarios", "charts", "batch", "portfolio"]
+
+# Dependencies a module must not import just by being imported
+LAZY = {
+    "metrics": ["yfinance", "matplotlib", "streamlit", "pandas"],
+    "storage": ["yfinance", "matplotlib", "streamlit"],
+    "holdings": ["yfinance", "matplotlib", "streamlit"],
+    "snapshot": ["yfinance", "matplotlib", "streamlit"],
+    "ledger": ["yfinance", "matplotlib", "streamlit"],
+    "prices": ["yfinance", "matplotlib", "streamlit"],
+    "feed": ["yfinance", "matplotlib", "streamlit"],
+    "history": ["yfinance", "matplotlib", "streamlit"],
+    "analytics": ["yfinance", "matplotlib", "streamlit"],
+    "scenarios": ["yfinance", "matplotlib", "streamlit"],
+    "charts": ["yfinance", "matplotlib", "streamlit"],
+    "batch": ["yfinance", "matplotlib", "streamlit"],
+    "portfolio": ["yfinance", "matplotlib"],
+}
+
+
+def _run(code, importtime=False):
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    start = time.perf_counter()
+    proc = subprocess.run(command, cwd=REPO_ROOT, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    return proc, elapsed
+
+
+def import_cost(module, repeat):
+    """Median (wall-clock ms of a fresh interpreter importing module, cumulative import ms of module itself)."""
+    walls, cumulative = [], []
+    for _ in range(repeat):
+        proc, elapsed = _run(f"import {module}", importtime=True)
+        walls.append(elapsed * 1000)
+        for line in proc.stderr.splitlines():
+            parts = [p.strip() for p in line.split("|")]
+            if len(parts) == 3 and parts[2] == module:
+                cumulative.append(int(parts[1]) / 1000)
+    return statistics.median(walls), statistics.median(cumulative) if cumulative else float("nan")
+
+
+def eager_imports(module):
+    """Lazy-only dependencies that importing module loaded anyway."""
+    banned = LAZY.get(module, [])
+    proc, _ = _run(f"import sys, {module}; print(' '.join(m for m in {banned!r} if m in sys.modules))")
+    return proc.stdout.split()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per module (median is reported).")
+    parser.add_argument("--json", help="Write results to this file for tracking over time.")
+    args = parser.parse_args(argv)
+
+    baseline, _ = import_cost("sys", args.repeat)
+    results, failed = {}, False
+    print(f"{'Module':<12} {'Process (ms)':>13} {'Import (ms)':>12}  Eager heavy imports")
+    print(f"{'(python)':<12} {baseline:>13.1f} {'':>12}")
+    for module in MODULES:
+        wall, cumulative = import_cost(module, args.repeat)
+        eager = eager_imports(module)
+        failed = failed or bool(eager)
+        results[module] = {"process_ms": round(wall, 1), "import_ms": round(cumulative, 1), "eager": eager}
+        print(f"{module:<12} {wall:>13.1f} {cumulative:>12.1f}  {' '.join(eager) or '-'}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"python_ms": round(baseline, 1), "modules": results}, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
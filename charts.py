@@ -0,0 +1,176 @@
+"""Portfolio chart data preparation and rendering: cached matplotlib PNGs or client-side Vega-Lite specs."""
+import hashlib
+import io
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+
+import metrics
+
+# Everything a chart draws, already aggregated: bar frames have stock_name/value, trend has date/series/value
+ChartData = namedtuple("ChartData", ["current_bars", "sold_bars", "trend", "trend_is_performance"])
+
+TOP_N = 25
+MAX_TREND_POINTS = 400
+OTHERS = "Others"
+
+_PNG_CACHE = OrderedDict()
+_PNG_CACHE_SIZE = 16
+_figure = None
+_figure_lock = threading.Lock()
+
+
+def _new_figure():
+    """Import matplotlib on first render, pinned to the non-interactive Agg backend."""
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib.figure import Figure
+    return Figure(figsize=(14, 14))
+
+
+def top_n_bars(names, values, n=TOP_N):
+    """Sum values per ticker, keep the n largest by magnitude and fold the rest into one Others bar."""
+    totals = pd.Series(np.asarray(values, dtype=np.float64), index=names).groupby(level=0, sort=False).sum()
+    if len(totals) > n:
+        keep = totals.abs().nlargest(n).index
+        others = totals.drop(keep).sum()
+        totals = totals[keep]
+        totals[OTHERS] = others
+    totals = totals.sort_values(ascending=False)
+    return pd.DataFrame({"stock_name": totals.index, "value": totals.to_numpy()})
+
+
+def downsample(df, max_points=MAX_TREND_POINTS):
+    """Every k-th row plus the last one, so long date ranges ship a bounded number of points."""
+    if len(df) <= max_points:
+        return df
+    step = -(-len(df) // max_points)
+    positions = np.unique(np.append(np.arange(0, len(df), step), len(df) - 1))
+    return df.iloc[positions]
+
+
+def chart_data(current_frame, sold_frame, nifty100_df, performance=None, top_n=TOP_N):
+    """Aggregate the current and sold tables and the trend line into bounded chart data."""
+    current_bars = top_n_bars(current_frame["stock_name"], current_frame["profit_loss"], top_n)
+    sold_bars = top_n_bars(sold_frame["stock_name"], sold_frame["booked_profit_loss"], top_n)
+    if performance is not None and not performance.empty:
+        columns = {"cum_return": "Current Portfolio", "benchmark_cum_return": "NIFTY 100", "drawdown": "Drawdown"}
+        wide = downsample(performance)[[c for c in columns if c in performance]] * 100
+        trend = wide.rename(columns=columns).rename_axis("date").reset_index().melt(
+            id_vars="date", var_name="series", value_name="value")
+        return ChartData(current_bars, sold_bars, trend, True)
+    trend = pd.DataFrame({"date": nifty100_df["date"], "series": "NIFTY 100", "value": nifty100_df["price"]})
+    return ChartData(current_bars, sold_bars, trend, False)
+
+
+def data_key(data):
+    """Content hash of everything the chart draws; equal data means an identical image."""
+    digest = hashlib.sha1(str(data.trend_is_performance).encode())
+    for df in (data.current_bars, data.sold_bars, data.trend):
+        digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _draw_bars(ax, bars, title, ylabel, label, empty_text, alpha=1.0):
+    if bars.empty:
+        ax.text(0.5, 0.5, empty_text, horizontalalignment="center", verticalalignment="center")
+    else:
+        colors = np.where(bars["value"].to_numpy() >= 0, "green", "red")
+        ax.bar(bars["stock_name"], bars["value"], color=colors, label=label, alpha=alpha)
+        ax.set_xlabel("Stock Name")
+        ax.set_ylabel(ylabel)
+        ax.grid(True, axis="y", linestyle="--", alpha=0.7)
+        ax.legend(loc="upper left")
+        ax.tick_params(axis="x", labelrotation=45)
+        for tick in ax.get_xticklabels():
+            tick.set_horizontalalignment("right")
+    ax.set_title(title)
+
+
+@metrics.timed("charts.plot")
+def plot_portfolios(data, fig=None):
+    """Draw current P&L, booked P&L and the book vs. NIFTY 100 (or the static NIFTY 100 trend) into fig."""
+    fig = fig or _new_figure()
+    fig.clear()
+    ax1, ax2, ax3 = fig.subplots(3, 1)
+    _draw_bars(ax1, data.current_bars, "Current Portfolio Unrealized Profit/Loss",
+               "Unrealized Profit/Loss (₹)", "Unrealized Profit/Loss (₹)", "No Current Portfolio Data")
+    _draw_bars(ax2, data.sold_bars, "Sold Portfolio Booked Profit/Loss",
+               "Booked Profit/Loss (₹)", "Booked Profit/Loss (₹)", "No Sold Portfolio Data", alpha=0.5)
+    colors = {"Current Portfolio": "green", "NIFTY 100": "blue", "Drawdown": "red"}
+    for series, points in data.trend.groupby("series", sort=False):
+        if series == "Drawdown":
+            ax3.fill_between(points["date"], points["value"], 0, color="red", alpha=0.15, label=series)
+        else:
+            marker = None if data.trend_is_performance else "o"
+            ax3.plot(points["date"], points["value"], color=colors.get(series), marker=marker, label=series)
+    if data.trend_is_performance:
+        ax3.set_ylabel("Cumulative Return (%)")
+        ax3.set_title("Current Portfolio vs. NIFTY 100")
+    else:
+        ax3.set_ylabel("NIFTY 100 Index (₹)", color="blue")
+        ax3.set_title("NIFTY 100 Trend (April 2025)")
+    ax3.grid(True, axis="y", linestyle="--", alpha=0.7)
+    ax3.legend(loc="upper left")
+    fig.tight_layout()
+    return fig
+
+
+def render_png(data, key=None):
+    """PNG bytes for the chart, cached by data hash; one Figure is reused instead of built per render."""
+    global _figure
+    key = key or data_key(data)
+    with _figure_lock:
+        if key in _PNG_CACHE:
+            metrics.count("chart_cache_hits")
+            _PNG_CACHE.move_to_end(key)
+            return _PNG_CACHE[key]
+        metrics.count("chart_cache_misses")
+        if _figure is None:
+            _figure = _new_figure()
+        plot_portfolios(data, _figure)
+        buf = io.BytesIO()
+        with metrics.span("charts.savefig"):
+            _figure.savefig(buf, format="png")
+        png = buf.getvalue()
+        _PNG_CACHE[key] = png
+        while len(_PNG_CACHE) > _PNG_CACHE_SIZE:
+            _PNG_CACHE.popitem(last=False)
+    return png
+
+
+def _bar_spec(title, ylabel):
+    return {
+        "title": title,
+        "mark": "bar",
+        "encoding": {
+            "x": {"field": "stock_name", "type": "nominal", "sort": None, "title": "Stock Name"},
+            "y": {"field": "value", "type": "quantitative", "title": ylabel},
+            "color": {"condition": {"test": "datum.value >= 0", "value": "green"}, "value": "red"},
+            "tooltip": [{"field": "stock_name"}, {"field": "value", "format": ",.2f"}],
+        },
+    }
+
+
+def vega_lite_specs(data):
+    """[(DataFrame, Vega-Lite spec)] for client-side rendering; only the aggregated chart data is shipped."""
+    charts = []
+    if not data.current_bars.empty:
+        charts.append((data.current_bars, _bar_spec("Current Portfolio Unrealized Profit/Loss", "Unrealized Profit/Loss (₹)")))
+    if not data.sold_bars.empty:
+        charts.append((data.sold_bars, _bar_spec("Sold Portfolio Booked Profit/Loss", "Booked Profit/Loss (₹)")))
+    title = "Current Portfolio vs. NIFTY 100" if data.trend_is_performance else "NIFTY 100 Trend (April 2025)"
+    ylabel = "Cumulative Return (%)" if data.trend_is_performance else "NIFTY 100 Index (₹)"
+    charts.append((data.trend, {
+        "title": title,
+        "mark": {"type": "line", "point": not data.trend_is_performance},
+        "encoding": {
+            "x": {"field": "date", "type": "temporal", "title": "Date"},
+            "y": {"field": "value", "type": "quantitative", "title": ylabel},
+            "color": {"field": "series", "type": "nominal", "title": None},
+            "tooltip": [{"field": "date", "type": "temporal"}, {"field": "series"}, {"field": "value", "format": ",.2f"}],
+        },
+    }))
+    return charts
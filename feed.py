@@ -0,0 +1,154 @@
+"""Server-wide live price feed: one background worker polls the union of watched tickers into a shared tick store.
+
+Sessions register the tickers they hold with TickStore.watch() and pull only
+the prices that changed since the version they last saw, so a server with N
+sessions holding M tickers makes one fetch per interval instead of N x M.
+"""
+import threading
+import time
+
+import pandas as pd
+
+import metrics
+from prices import StaticPriceProvider
+
+
+class TickStore:
+    """Latest price per ticker, each stamped with the store version that last changed it and its wall time."""
+
+    def __init__(self, watch_ttl=300.0, clock=time.monotonic, timestamp=time.time):
+        self.watch_ttl = watch_ttl
+        self.clock = clock
+        self.timestamp = timestamp
+        self.version = 0
+        self._prices = {}  # ticker -> (price, version, epoch seconds)
+        self._watchers = {}  # watcher key -> (tickers, last seen)
+        self._lock = threading.Lock()
+
+    def publish(self, prices):
+        """Store {ticker: price}; only prices that differ from the stored ones bump the version. Returns changes."""
+        with self._lock:
+            changed = {t: p for t, p in prices.items() if p is not None and self._prices.get(t, (None,))[0] != p}
+            if changed:
+                self.version += 1
+                now = self.timestamp()
+                for ticker, price in changed.items():
+                    self._prices[ticker] = (price, self.version, now)
+        return len(changed)
+
+    def since(self, version, marked=None):
+        """({ticker: price} changed after version, current version).
+
+        marked is {ticker: epoch seconds} of recorded prices; a tick no newer
+        than its ticker's recorded price is stale and left out.
+        """
+        marked = marked or {}
+        with self._lock:
+            changed = {t: p for t, (p, v, at) in self._prices.items() if v > version and at > marked.get(t, 0.0)}
+            return changed, self.version
+
+    def watch(self, key, tickers):
+        """Register (or refresh) the tickers one watcher, e.g. a browser session, wants priced."""
+        with self._lock:
+            self._watchers[key] = (tuple(tickers), self.clock())
+
+    def watched(self):
+        """Union of tickers from watchers seen within watch_ttl seconds, in first-seen order."""
+        now = self.clock()
+        with self._lock:
+            for key in [k for k, (_, seen) in self._watchers.items() if now - seen > self.watch_ttl]:
+                del self._watchers[key]
+            return list(dict.fromkeys(t for tickers, _ in self._watchers.values() for t in tickers))
+
+
+class EngineSource:
+    """Poll live prices through a PriceEngine's TTL cache; static fallback prices are not ticks.
+
+    Going through the cache means a poll only fetches quotes older than the
+    engine's ttl, whatever the feed interval, and shares them with page lookups.
+    error holds the last provider failure until live quotes come back; cached
+    fallbacks between fetches do not clear it.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.error = None
+
+    def __call__(self, tickers):
+        quotes, errors = self.engine.lookup(tickers)
+        live = {t: q.price for t, q in quotes.items() if q is not None and q.source != StaticPriceProvider.name}
+        if errors:
+            self.error = "; ".join(f"{provider}: {error}" for provider, error in errors.items())
+        elif live:
+            self.error = None
+        return live
+
+
+class ReplaySource:
+    """Replay recorded ticks from a CSV of timestamp,ticker,price rows: one timestamp per poll, looping at the end."""
+
+    def __init__(self, path, loop=True):
+        df = pd.read_csv(path)
+        self.batches = [dict(zip(group["ticker"], group["price"].astype(float)))
+                        for _, group in df.sort_values("timestamp", kind="stable").groupby("timestamp", sort=True)]
+        self.loop = loop
+        self.position = 0
+
+    def __call__(self, tickers):
+        if self.position >= len(self.batches):
+            if not self.loop or not self.batches:
+                return {}
+            self.position = 0
+        batch = self.batches[self.position]
+        self.position += 1
+        wanted = set(tickers)
+        return {t: p for t, p in batch.items() if t in wanted}
+
+
+class PriceFeed:
+    """Daemon thread calling source(tickers) every interval seconds for the store's watched tickers.
+
+    error describes why the last poll failed: an exception it raised, or the
+    source's own error attribute when it reports failures without raising.
+    """
+
+    def __init__(self, source, store=None, interval=60.0):
+        self.source = source
+        self.store = store or TickStore()
+        self.interval = interval
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll_once(self):
+        """Fetch the watched tickers once and publish them; returns the number of prices that changed."""
+        tickers = self.store.watched()
+        if not tickers:
+            return 0
+        with metrics.span("feed.poll"):
+            prices = self.source(tickers)
+        metrics.count("feed_polls")
+        changed = self.store.publish(prices)
+        metrics.count("feed_ticks", changed)
+        return changed
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+                self.error = getattr(self.source, "error", None)
+            except Exception as e:
+                self.error = f"{type(e).__name__}: {e}"
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="price-feed", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
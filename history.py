@@ -0,0 +1,182 @@
+"""Local daily close history per ticker and vectorized portfolio performance against NIFTY 100."""
+import json
+import os
+import re
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from storage import atomic_write, file_lock
+
+# yfinance symbol for the NIFTY 100 index
+NIFTY100 = "^CNX100"
+
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = "history.lock"
+
+
+def _to_days(dates):
+    """Dates as int32 days since 1970-01-01."""
+    return pd.DatetimeIndex(dates).normalize().values.astype("datetime64[D]").astype(np.int32)
+
+
+class HistoryStore:
+    """Append-only daily closes, two raw memory-mappable files per ticker (days as int32, closes as float64).
+
+    A small manifest keeps each ticker's last stored day and row count, so
+    deciding what to fetch never touches the data files. Rows past the count
+    (an append interrupted between the two files) are ignored by readers and
+    cut by the next writer, so days and closes always stay paired.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_FILE)
+        self.lock_path = os.path.join(directory, LOCK_FILE)
+        self._manifest = None
+        self._manifest_stamp = None
+
+    def _paths(self, ticker):
+        stem = os.path.join(self.directory, re.sub(r"[^A-Za-z0-9_.-]", "_", ticker))
+        return stem + ".days", stem + ".close"
+
+    @property
+    def manifest(self):
+        """{ticker: {"last": last stored day, "rows": rows stored}}, re-read only when another writer has replaced the file."""
+        stamp = self.signature()
+        if self._manifest is None or stamp != self._manifest_stamp:
+            if os.path.exists(self.manifest_path):
+                with open(self.manifest_path) as f:
+                    self._manifest = json.load(f)
+            else:
+                self._manifest = {}
+            self._manifest_stamp = stamp
+        return self._manifest
+
+    def _write_manifest(self):
+        atomic_write(self.manifest_path, json.dumps(self._manifest))
+        self._manifest_stamp = self.signature()
+
+    def signature(self):
+        """Version key that changes whenever any ticker gains rows."""
+        try:
+            stat = os.stat(self.manifest_path)
+            return f"{os.path.abspath(self.directory)}|{stat.st_size}:{stat.st_mtime_ns}"
+        except FileNotFoundError:
+            return f"{os.path.abspath(self.directory)}|-"
+
+    def last_day(self, ticker):
+        """Last stored date for a ticker, or None."""
+        entry = self.manifest.get(ticker)
+        return None if entry is None else date.fromordinal(date(1970, 1, 1).toordinal() + entry["last"])
+
+    def append(self, closes):
+        """Append a frame of daily closes (date index, ticker columns), keeping only days after each ticker's last.
+
+        Writers are serialized by a lock file and re-read the manifest inside
+        it, so two sessions updating at once never store a day twice. Returns
+        the number of rows written.
+        """
+        if closes.empty:
+            return 0
+        os.makedirs(self.directory, exist_ok=True)
+        days = _to_days(closes.index)
+        written = 0
+        with file_lock(self.lock_path):
+            manifest = self.manifest
+            for ticker in closes.columns:
+                values = closes[ticker].to_numpy(dtype=np.float64)
+                keep = ~np.isnan(values)
+                entry = manifest.get(ticker)
+                if entry is not None:
+                    keep &= days > entry["last"]
+                if not keep.any():
+                    continue
+                rows = entry["rows"] if entry is not None else 0
+                days_path, close_path = self._paths(ticker)
+                for path, array in ((days_path, days[keep]), (close_path, values[keep])):
+                    with open(path, "ab") as f:
+                        # Cut rows an interrupted append left past the manifest before adding ours
+                        f.truncate(rows * array.itemsize)
+                        f.write(array.tobytes())
+                manifest[ticker] = {"last": int(days[keep][-1]), "rows": rows + int(keep.sum())}
+                written += int(keep.sum())
+            if written:
+                self._write_manifest()
+        return written
+
+    def series(self, ticker):
+        """Stored closes for one ticker as a date-indexed Series, read through a memory map."""
+        entry = self.manifest.get(ticker)
+        if entry is None or not entry["rows"]:
+            return pd.Series(dtype=np.float64, name=ticker)
+        days_path, close_path = self._paths(ticker)
+        # Only rows the manifest counts are committed; anything after them is a torn append
+        size = entry["rows"]
+        days = np.memmap(days_path, dtype=np.int32, mode="r", shape=(size,))
+        closes = np.memmap(close_path, dtype=np.float64, mode="r", shape=(size,))
+        index = pd.DatetimeIndex(days.astype("datetime64[D]"))
+        return pd.Series(np.array(closes), index=index, name=ticker)
+
+    def frame(self, tickers, start=None, end=None):
+        """Closes for many tickers aligned on their union of trading days."""
+        columns = {ticker: self.series(ticker) for ticker in tickers}
+        df = pd.DataFrame(columns) if columns else pd.DataFrame()
+        df = df.sort_index()
+        if start is not None or end is not None:
+            df = df.loc[pd.Timestamp(start) if start else None:pd.Timestamp(end) if end else None]
+        return df
+
+    @metrics.timed("history.update")
+    def update(self, provider, tickers, end=None, backfill_days=365):
+        """Fetch only the missing days for each ticker; tickers sharing a start date go in one bulk call.
+
+        New tickers are backfilled backfill_days before end. end is capped at
+        yesterday: today's bar is an intraday price until the session closes,
+        and a stored day is never fetched again. Returns rows written.
+        """
+        end = min(end or date.today(), date.today() - timedelta(days=1))
+        starts = {}
+        for ticker in dict.fromkeys(tickers):
+            last = self.last_day(ticker)
+            start = end - timedelta(days=backfill_days) if last is None else last + timedelta(days=1)
+            if start <= end:
+                starts.setdefault(start, []).append(ticker)
+        written = 0
+        for start, group in sorted(starts.items()):
+            written += self.append(provider.fetch_history(group, start, end))
+        return written
+
+
+@metrics.timed("history.portfolio_timeseries")
+def portfolio_timeseries(current, store, start=None, end=None, benchmark=NIFTY100):
+    """Daily value, returns, drawdown and performance relative to the benchmark for the current holdings.
+
+    Holdings are taken as constant over the range (today's book replayed over
+    history). A ticker with no close yet on a day is carried at its first
+    stored close, so late listings do not show as jumps in value.
+    """
+    if current.empty:
+        return pd.DataFrame()
+    frame = current.frame()
+    quantities = frame.groupby("stock_name", sort=False)["quantity"].sum()
+    closes = store.frame(quantities.index, start, end)
+    if closes.empty:
+        return pd.DataFrame()
+    closes = closes.dropna(axis=1, how="all").ffill().bfill()
+    held = closes.columns
+    value = closes.to_numpy() @ quantities[held].to_numpy(dtype=np.float64)
+    result = pd.DataFrame({"value": value}, index=closes.index)
+    result["return"] = result["value"].pct_change().fillna(0.0)
+    result["cum_return"] = result["value"] / result["value"].iloc[0] - 1
+    result["drawdown"] = result["value"] / result["value"].cummax() - 1
+    bench = store.series(benchmark)
+    if not bench.empty:
+        bench = bench.reindex(result.index).ffill().bfill()
+        result["benchmark"] = bench
+        result["benchmark_cum_return"] = bench / bench.iloc[0] - 1
+        # Growth of the book relative to growth of the index since the start of the range
+        result["relative"] = (1 + result["cum_return"]) / (1 + result["benchmark_cum_return"]) - 1
+    return result
@@ -0,0 +1,361 @@
+"""Columnar current and sold portfolios backed by typed NumPy arrays."""
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+
+class ColumnTable:
+    """Growable typed column arrays with a ticker->rows hash index and derived values cached until mutation.
+
+    Deleted rows are tombstoned and only compacted on the next read, so trades
+    cost O(rows touched) however many rows the table holds.
+    """
+    columns = {}
+
+    def __init__(self, capacity=16):
+        self._n = 0
+        self._data = {name: np.empty(capacity, dtype=dtype) for name, dtype in self.columns.items()}
+        self._live = np.ones(capacity, dtype=bool)
+        self._dead = 0
+        self._index = {}  # ticker -> deque of live row positions, oldest first
+        self._shares = {}  # ticker -> total quantity over its live rows
+        self._cache = {}
+        self.version = 0
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build a table from a DataFrame holding at least the stored columns."""
+        return cls.from_columns({name: df[name].to_numpy() for name in cls.columns})
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Build a table from {column: sequence} for every stored column."""
+        size = len(columns["stock_name"])
+        table = cls(capacity=max(16, size))
+        if size:
+            table._append(**columns)
+        return table
+
+    def copy(self):
+        """Independent table holding the same live rows."""
+        return self.from_columns({name: self.col(name) for name in self.columns})
+
+    def to_columns(self):
+        """Stored columns as plain Python lists."""
+        return {name: self.col(name).tolist() for name in self.columns}
+
+    def __len__(self):
+        return self._n - self._dead
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    def col(self, name):
+        """Read-only view of the live rows of one stored column."""
+        self._compact()
+        view = self._data[name][:self._n]
+        view.flags.writeable = False
+        return view
+
+    def _invalidate(self):
+        self._cache.clear()
+        self.version += 1
+
+    def _cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def _append(self, **values):
+        """Append rows, broadcasting scalars; capacity doubles so appends are amortized O(1)."""
+        arrays = {name: np.atleast_1d(np.asarray(values[name], dtype=dtype)) for name, dtype in self.columns.items()}
+        count = max(len(a) for a in arrays.values())
+        end = self._n + count
+        capacity = len(self._live)
+        if end > capacity:
+            capacity = max(end, capacity * 2)
+            for name, data in self._data.items():
+                grown = np.empty(capacity, dtype=data.dtype)
+                grown[:self._n] = data[:self._n]
+                self._data[name] = grown
+            live = np.ones(capacity, dtype=bool)
+            live[:self._n] = self._live[:self._n]
+            self._live = live
+        for name, array in arrays.items():
+            self._data[name][self._n:end] = np.broadcast_to(array, (count,))
+        self._live[self._n:end] = True
+        quantity = self._data["quantity"]
+        for pos, name in enumerate(self._data["stock_name"][self._n:end], start=self._n):
+            self._index.setdefault(name, deque()).append(pos)
+            self._shares[name] = self._shares.get(name, 0) + int(quantity[pos])
+        self._n = end
+        self._invalidate()
+
+    def _kill(self, pos):
+        """Tombstone one row; O(1) when it is the oldest or newest row of its ticker."""
+        name = self._data["stock_name"][pos]
+        rows = self._index[name]
+        if rows[0] == pos:
+            rows.popleft()
+        elif rows[-1] == pos:
+            rows.pop()
+        else:
+            rows.remove(pos)
+        self._shares[name] -= int(self._data["quantity"][pos])
+        if not rows:
+            del self._index[name]
+            del self._shares[name]
+        self._live[pos] = False
+        self._dead += 1
+
+    def _compact(self):
+        """Physically drop tombstoned rows and renumber the index."""
+        if not self._dead:
+            return
+        mask = self._live[:self._n]
+        for data in self._data.values():
+            kept = data[:self._n][mask]
+            data[:len(kept)] = kept
+        self._n -= self._dead
+        self._dead = 0
+        self._live[:] = True
+        self._index = {}
+        for pos, name in enumerate(self._data["stock_name"][:self._n]):
+            self._index.setdefault(name, deque()).append(pos)
+
+    def rows(self, name):
+        """Live row positions held for a ticker, oldest first."""
+        self._compact()
+        return list(self._index.get(name, ()))
+
+    def tickers(self):
+        """Distinct tickers in first-seen order."""
+        return list(self._index)
+
+    def remove(self, name):
+        """Remove the first row held for a ticker."""
+        if name not in self._index:
+            raise KeyError(name)
+        self._kill(self._index[name][0])
+        self._invalidate()
+
+
+def _percent(change, base):
+    """Percentage change over base, 0 where base is not positive."""
+    out = np.zeros(len(base))
+    np.divide(change * 100, base, out=out, where=base > 0)
+    return out
+
+
+# Lot matching methods for sells
+FIFO = "fifo"
+LIFO = "lifo"
+AVERAGE = "average"
+LOT_METHODS = (FIFO, LIFO, AVERAGE)
+
+
+class Portfolio(ColumnTable):
+    """Current holdings, one row per purchase lot; P&L, values and totals are derived and cached until mutation."""
+    columns = {
+        "stock_name": object,
+        "stock_pur_price": np.float64,
+        "stock_cur_price": np.float64,
+        "quantity": np.int64,
+    }
+
+    def add(self, names, pur_prices, cur_prices, quantities):
+        """Add one or many purchase lots; every argument may be a scalar or an array."""
+        self._append(stock_name=names, stock_pur_price=pur_prices, stock_cur_price=cur_prices, quantity=quantities)
+
+    def reprice(self, prices):
+        """Set the current price of every lot whose ticker is in {ticker: price}; return lots updated.
+
+        Derived P&L values and totals are patched for the changed lots only,
+        so a tick for a few tickers costs O(lots touched), not O(book).
+        """
+        if self.empty or not prices:
+            return 0
+        # Through the ticker index, so a mark for a few tickers does not scan every lot
+        changed = []
+        for ticker, price in prices.items():
+            rows = self._index.get(ticker)
+            if rows is None or price is None or np.isnan(price):
+                continue
+            changed.append(np.fromiter(rows, dtype=np.intp, count=len(rows)))
+            self._data["stock_cur_price"][changed[-1]] = price
+        if not changed:
+            return 0
+        positions = np.concatenate(changed)
+        self._patch_derived(positions)
+        return len(positions)
+
+    def quantity_held(self, name):
+        """Total shares held for a ticker across its open lots."""
+        return self._shares.get(name, 0)
+
+    def sell(self, name, qty, sold_price, method=FIFO):
+        """Sell qty shares of a ticker, matching lots by FIFO, LIFO or average cost.
+
+        Returns realized records as {column: list} for SoldPortfolio.add: one
+        per lot consumed for FIFO/LIFO, a single record at the average cost
+        otherwise. Only the ticker's lots are touched.
+        """
+        if method not in LOT_METHODS:
+            raise ValueError(f"Unknown lot matching method: {method}")
+        held = self.quantity_held(name)
+        if not 0 < qty <= held:
+            raise ValueError(f"Cannot sell {qty} of {held} shares of {name}.")
+        quantity = self._data["quantity"]
+        pur_price = self._data["stock_pur_price"]
+        lots = self._index[name]
+        if method == AVERAGE:
+            # Remaining shares carry the average cost, so later sells stay consistent with it
+            average = sum(pur_price[pos] * quantity[pos] for pos in lots) / held
+            for pos in lots:
+                pur_price[pos] = average
+        sold_pur, sold_qty = [], []
+        remaining = qty
+        while remaining:
+            pos = lots[-1] if method == LIFO else lots[0]
+            take = min(remaining, int(quantity[pos]))
+            sold_pur.append(float(pur_price[pos]))
+            sold_qty.append(take)
+            quantity[pos] -= take
+            self._shares[name] -= take
+            remaining -= take
+            if quantity[pos] == 0:
+                self._kill(pos)
+        self._invalidate()
+        if method == AVERAGE:
+            sold_pur, sold_qty = sold_pur[:1], [qty]
+        return {
+            "stock_name": [name] * len(sold_qty),
+            "stock_pur_price": sold_pur,
+            "stock_sold_price": [float(sold_price)] * len(sold_qty),
+            "quantity": sold_qty,
+        }
+
+    def remove(self, name):
+        """Remove every open lot held for a ticker."""
+        if name not in self._index:
+            raise KeyError(name)
+        for pos in list(self._index[name]):
+            self._kill(pos)
+        self._invalidate()
+
+    def _lot_values(self, positions=slice(None)):
+        """Rounded current price, P&L and value for the lots at raw positions."""
+        pur = self._data["stock_pur_price"][:self._n][positions]
+        cur = self._data["stock_cur_price"][:self._n][positions]
+        qty = self._data["quantity"][:self._n][positions]
+        change = cur - pur
+        rounded_cur = np.round(cur, 2)
+        return {
+            "stock_cur_price": rounded_cur,
+            "profit_loss": np.round(change * qty, 2),
+            "percent_profit_loss": np.round(_percent(change, pur), 2),
+            "current_value": np.round(rounded_cur * qty, 2),
+        }
+
+    def _derived(self):
+        """Per-lot derived values aligned with the live rows."""
+        def build():
+            self._compact()
+            return self._lot_values()
+        return self._cached("derived", build)
+
+    def _patch_derived(self, positions):
+        """Update cached derived values and totals in place of a full rebuild after a price change."""
+        derived = self._cache.get("derived")
+        totals = self._cache.get("totals")
+        self.version += 1
+        if derived is None or self._dead:
+            # Positions only line up with cached rows while nothing is tombstoned
+            self._cache.clear()
+            return
+        patch = self._lot_values(positions)
+        self._cache = {"derived": derived}
+        if totals is not None:
+            profit_loss = totals["profit_loss"] + float(patch["profit_loss"].sum() - derived["profit_loss"][positions].sum())
+            current_value = totals["current_value"] + float(
+                patch["current_value"].sum() - derived["current_value"][positions].sum())
+            self._cache["totals"] = self._totals(current_value, totals["investment"], profit_loss)
+        for name, values in patch.items():
+            derived[name][positions] = values
+
+    @staticmethod
+    def _totals(current_value, investment, profit_loss):
+        return {
+            "current_value": current_value,
+            "investment": investment,
+            "profit_loss": profit_loss,
+            "percent_profit_loss": (profit_loss / investment * 100) if investment > 0 else 0,
+        }
+
+    def frame(self):
+        """Display table rounded to 2 decimals, with P&L and current value."""
+        def build():
+            derived = self._derived()
+            return pd.DataFrame({
+                "stock_name": self.col("stock_name"),
+                "stock_pur_price": np.round(self.col("stock_pur_price"), 2),
+                "stock_cur_price": derived["stock_cur_price"],
+                "quantity": self.col("quantity"),
+                "profit_loss": derived["profit_loss"],
+                "percent_profit_loss": derived["percent_profit_loss"],
+                "current_value": derived["current_value"],
+            })
+        return self._cached("frame", build)
+
+    def totals(self):
+        """Total current value, investment and unrealized profit/loss."""
+        def build():
+            derived = self._derived()
+            investment = float((np.round(self.col("stock_pur_price"), 2) * self.col("quantity")).sum())
+            return self._totals(float(derived["current_value"].sum()), investment, float(derived["profit_loss"].sum()))
+        return self._cached("totals", build)
+
+
+class SoldPortfolio(ColumnTable):
+    """Realized sales; booked profit/loss and totals are derived and cached until the next mutation."""
+    columns = {
+        "stock_name": object,
+        "stock_pur_price": np.float64,
+        "stock_sold_price": np.float64,
+        "quantity": np.int64,
+    }
+
+    def add(self, stock_name, stock_pur_price, stock_sold_price, quantity):
+        """Record one or many sales; every argument may be a scalar or an array."""
+        self._append(stock_name=stock_name, stock_pur_price=stock_pur_price,
+                     stock_sold_price=stock_sold_price, quantity=quantity)
+
+    def frame(self):
+        """Display table rounded to 2 decimals, with booked P&L."""
+        def build():
+            qty = self.col("quantity")
+            change = self.col("stock_sold_price") - self.col("stock_pur_price")
+            return pd.DataFrame({
+                "stock_name": self.col("stock_name"),
+                "stock_pur_price": np.round(self.col("stock_pur_price"), 2),
+                "stock_sold_price": np.round(self.col("stock_sold_price"), 2),
+                "quantity": qty,
+                "booked_profit_loss": np.round(change * qty, 2),
+                "percent_booked_profit_loss": np.round(_percent(change, self.col("stock_pur_price")), 2),
+            })
+        return self._cached("frame", build)
+
+    def totals(self):
+        """Total investment and booked profit/loss."""
+        def build():
+            df = self.frame()
+            total_booked_profit_loss = float(df["booked_profit_loss"].sum())
+            total_investment = float((df["stock_pur_price"] * df["quantity"]).sum())
+            return {
+                "investment": total_investment,
+                "booked_profit_loss": total_booked_profit_loss,
+                "percent_booked_profit_loss": (total_booked_profit_loss / total_investment * 100) if total_investment > 0 else 0,
+            }
+        return self._cached("totals", build)
@@ -0,0 +1,228 @@
+"""Append-only JSON-lines event log of trades and price marks, with compacted snapshots."""
+import json
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from holdings import FIFO, Portfolio, SoldPortfolio
+import metrics
+import snapshot
+from storage import file_lock
+
+LEDGER_FILE = "portfolio_ledger.jsonl"
+SNAPSHOT_FILE = "portfolio_snapshot.arrow"
+LOCK_FILE = "portfolio.lock"
+
+# CSV files written by earlier versions of the app, imported once into a first snapshot
+LEGACY_CURRENT_CSV = "current_portfolio.csv"
+LEGACY_SOLD_CSV = "sold_portfolio.csv"
+
+
+def apply_event(current, sold, event):
+    """Apply one ledger event to the current and sold tables."""
+    kind = event["type"]
+    if kind == "add":
+        current.add(event["stock_name"], event["stock_pur_price"], event["stock_cur_price"], event["quantity"])
+    elif kind == "sell":
+        sold.add(**current.sell(event["stock_name"], event["quantity"], event["stock_sold_price"],
+                                event.get("method", FIFO)))
+    elif kind == "reprice":
+        current.reprice(event["prices"])
+    elif kind == "remove":
+        (current if event["portfolio"] == "current" else sold).remove(event["stock_name"])
+    else:
+        raise ValueError(f"Unknown ledger event type: {kind}")
+
+
+def price_marks(event):
+    """{ticker: epoch seconds} for the current prices an add or reprice event recorded."""
+    if event["type"] == "add":
+        tickers = [event["stock_name"]]
+    elif event["type"] == "reprice":
+        tickers = list(event["prices"])
+    else:
+        return {}
+    at = datetime.fromisoformat(event["ts"]).timestamp()
+    return dict.fromkeys(tickers, at)
+
+
+class Ledger:
+    """Event log in one directory: every action appends a line, a snapshot is compacted every N events.
+
+    The snapshot records the log's byte offset at the time it was taken, so
+    loading seeks straight to the tail instead of replaying full history.
+    Writers from any session or process take an advisory lock and first
+    replay events appended by others since their last read; readers never
+    lock and see either the old or the new snapshot, and only complete lines.
+    """
+
+    def __init__(self, directory=".", snapshot_every=100):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.ledger_path = os.path.join(directory, LEDGER_FILE)
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.lock_path = os.path.join(directory, LOCK_FILE)
+        self.seq = 0
+        self.snapshot_seq = 0
+        # Byte offset just past the last event applied to the tables this ledger handed out
+        self.offset = 0
+        # Ticker -> epoch seconds its current price was last recorded, so older live ticks can be ignored
+        self.marked = {}
+
+    def exists(self):
+        return any(os.path.exists(path) for path in (self.ledger_path, self.snapshot_path))
+
+    def signature(self):
+        """Cheap version key for the stored book: its directory plus size and mtime of the log and snapshot.
+
+        The log is append-only, so any recorded event changes its size.
+        """
+        parts = [os.path.abspath(self.directory)]
+        for path in (self.ledger_path, self.snapshot_path):
+            try:
+                stat = os.stat(path)
+                parts.append(f"{stat.st_size}:{stat.st_mtime_ns}")
+            except FileNotFoundError:
+                parts.append("-")
+        return "|".join(parts)
+
+    def _read_snapshot(self):
+        if os.path.exists(self.snapshot_path):
+            return snapshot.read(self.snapshot_path)
+        return {"seq": 0, "offset": 0, "current": None, "sold": None}
+
+    def tickers(self):
+        """Tickers the book may hold, read without rebuilding its tables or writing anything.
+
+        Snapshot holdings plus every ticker added after the snapshot, so a
+        ticker sold out since then may still be listed.
+        """
+        if os.path.exists(self.snapshot_path):
+            held, offset = snapshot.read_tickers(self.snapshot_path)
+        else:
+            held, offset = [], 0
+        added = [event["stock_name"] for event in self.events(offset) if event["type"] == "add"]
+        return list(dict.fromkeys(held + added))
+
+    @metrics.timed("ledger.load")
+    def load(self):
+        """Return (current, sold) rebuilt from the latest snapshot plus the events after it."""
+        stored = self._read_snapshot()
+        current = Portfolio.from_columns(stored["current"]) if stored["current"] else Portfolio()
+        sold = SoldPortfolio.from_columns(stored["sold"]) if stored["sold"] else SoldPortfolio()
+        self.seq = self.snapshot_seq = stored["seq"]
+        self.offset = stored["offset"]
+        self.marked = dict(stored.get("marked", {}))
+        self._catch_up(current, sold)
+        return current, sold
+
+    def _read(self, offset):
+        """Yield (event, offset after it) for complete lines from a byte offset."""
+        if not os.path.exists(self.ledger_path):
+            return
+        with open(self.ledger_path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                yield json.loads(line), offset
+
+    def events(self, offset=0):
+        """Yield events from a byte offset; a torn final line from an interrupted write is ignored."""
+        for event, _ in self._read(offset):
+            yield event
+
+    def _catch_up(self, current, sold):
+        """Apply events other writers appended after this ledger's offset."""
+        for event, offset in self._read(self.offset):
+            if event["seq"] > self.seq:
+                apply_event(current, sold, event)
+                self.marked.update(price_marks(event))
+                self.seq = event["seq"]
+            self.offset = offset
+
+    def _repair_tail(self):
+        """Cut a torn final line left by a crashed writer, so the next append starts on a fresh line."""
+        if not os.path.exists(self.ledger_path):
+            return
+        with open(self.ledger_path, "r+b") as f:
+            size = f.seek(0, os.SEEK_END)
+            if not size:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            f.seek(0)
+            data = f.read()
+            f.truncate(data.rfind(b"\n") + 1)
+
+    @metrics.timed("ledger.record")
+    def record(self, current, sold, event_type, **fields):
+        """Append an event, apply it to the tables and compact a snapshot when one is due.
+
+        The tables are first brought up to date with events other writers
+        recorded meanwhile, so a trade is checked against the latest book and
+        no one's event is lost.
+        """
+        with file_lock(self.lock_path):
+            self._catch_up(current, sold)
+            event = {"seq": self.seq + 1, "ts": datetime.now().isoformat(timespec="milliseconds"), "type": event_type, **fields}
+            # Apply first so an invalid trade raises before anything reaches the log
+            apply_event(current, sold, event)
+            self.marked.update(price_marks(event))
+            self._repair_tail()
+            with open(self.ledger_path, "ab") as f:
+                f.write(json.dumps(event).encode() + b"\n")
+                f.flush()
+                os.fsync(f.fileno())
+                self.offset = f.tell()
+            self.seq = event["seq"]
+            if self.seq - self.snapshot_seq >= self.snapshot_every:
+                self.write_snapshot(current, sold)
+        return event
+
+    @metrics.timed("ledger.write_snapshot")
+    def write_snapshot(self, current, sold):
+        """Write a compacted snapshot of both tables atomically via write-then-rename; call with the lock held."""
+        snapshot.write(self.snapshot_path, current, sold, self.seq, self.offset, self.marked)
+        self.snapshot_seq = self.seq
+
+
+def read_legacy_csv(csv_file, table_cls):
+    """Read one legacy portfolio CSV into a table, skipping the Total row; P&L columns are recomputed, not trusted.
+
+    Returns (table, problem), where problem says why the file was ignored, or is None.
+    """
+    if not os.path.exists(csv_file):
+        return table_cls(), None
+    try:
+        df = pd.read_csv(csv_file)
+        if df.empty or not all(col in df.columns for col in table_cls.columns):
+            return table_cls(), f"{csv_file} is empty or missing required columns. Starting with empty portfolio."
+        df = df[df["stock_name"] != "Total"]
+        if df.empty:
+            return table_cls(), f"{csv_file} contains only 'Total' row or is empty. Starting with empty portfolio."
+        return table_cls.from_frame(df), None
+    except Exception as e:
+        return table_cls(), f"Error loading {csv_file}: {e}. Starting with empty portfolio."
+
+
+def import_legacy_csvs(ledger):
+    """Seed a ledger that has no history yet from legacy CSVs in its directory; return any problems found."""
+    if ledger.exists():
+        return []
+    current_csv = os.path.join(ledger.directory, LEGACY_CURRENT_CSV)
+    sold_csv = os.path.join(ledger.directory, LEGACY_SOLD_CSV)
+    if not (os.path.exists(current_csv) or os.path.exists(sold_csv)):
+        return []
+    with file_lock(ledger.lock_path):
+        # Another session may have imported while this one waited for the lock
+        if ledger.exists():
+            return []
+        current, current_problem = read_legacy_csv(current_csv, Portfolio)
+        sold, sold_problem = read_legacy_csv(sold_csv, SoldPortfolio)
+        ledger.write_snapshot(current, sold)
+    return [problem for problem in (current_problem, sold_problem) if problem]
+
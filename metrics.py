@@ -0,0 +1,170 @@
+"""Lightweight instrumentation: timing spans, counters, per-rerun traces and optional cProfile capture.
+
+Enabled by setting PORTFOLIO_METRICS=1 (or calling enable()). While disabled,
+span(), timed() and count() cost a single flag check, so call sites stay in
+hot paths unconditionally. Totals are kept per process and can be exported
+as Prometheus text; each trace() also logs one JSON line to the
+"portfolio.metrics" logger, which prints to stderr at INFO unless the
+application has configured handlers for it.
+"""
+import cProfile
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger("portfolio.metrics")
+
+_enabled = False
+_lock = threading.Lock()
+_spans = {}  # name -> [count, total seconds, max seconds]
+_counters = {}
+_local = threading.local()
+_NULL = nullcontext()
+
+
+def enabled():
+    return _enabled
+
+
+def enable(on=True):
+    """Turn recording on or off; turning it on also makes sure trace lines reach stderr."""
+    global _enabled
+    _enabled = on
+    if on and not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        # Our own handler prints the line; do not print it again through the root logger
+        logger.propagate = False
+
+
+enable(os.environ.get("PORTFOLIO_METRICS", "") not in ("", "0"))
+
+
+def reset():
+    """Forget all recorded spans and counters."""
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+
+def count(name, n=1):
+    """Add n to a counter."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+@contextmanager
+def _timing(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            stats = _spans.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+        trace = getattr(_local, "trace", None)
+        if trace is not None:
+            trace.append((name, elapsed * 1000))
+
+
+def span(name):
+    """Context manager timing the enclosed block under name."""
+    return _timing(name) if _enabled else _NULL
+
+
+def timed(name=None):
+    """Decorator timing every call of a function, under its qualified name by default."""
+    def decorate(function):
+        label = name or f"{function.__module__}.{function.__qualname__}"
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _timing(label):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def trace(label="rerun"):
+    """Collect the [(span, ms)] finished on this thread inside the block, in completion order."""
+    spans = []
+    previous = getattr(_local, "trace", None)
+    _local.trace = spans
+    start = time.perf_counter()
+    try:
+        yield spans
+    finally:
+        _local.trace = previous
+        if _enabled:
+            total = (time.perf_counter() - start) * 1000
+            logger.info(json.dumps({"trace": label, "ms": round(total, 2),
+                                    "spans": [[name, round(ms, 2)] for name, ms in spans]}))
+
+
+class Profile:
+    """Result holder for profiled(): stats text once the block has finished, else None."""
+
+    def __init__(self):
+        self.text = None
+
+
+@contextmanager
+def profiled(active=True, limit=25):
+    """Run the block under cProfile when active; the yielded Profile holds the top functions by cumulative time."""
+    result = Profile()
+    if not active:
+        yield result
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield result
+    finally:
+        profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+        result.text = out.getvalue()
+
+
+def snapshot():
+    """{"spans": {name: {count, total_ms, mean_ms, max_ms}}, "counters": {name: value}}."""
+    with _lock:
+        spans = {name: {"count": n, "total_ms": total * 1000, "mean_ms": total * 1000 / n, "max_ms": peak * 1000}
+                 for name, (n, total, peak) in _spans.items()}
+        return {"spans": spans, "counters": dict(_counters)}
+
+
+def _metric_name(name):
+    return "".join(c if c.isalnum() else "_" for c in name)
+
+
+def prometheus_text(prefix="portfolio"):
+    """Current totals in the Prometheus text exposition format."""
+    data = snapshot()
+    lines = []
+    for name, value in sorted(data["counters"].items()):
+        metric = f"{prefix}_{_metric_name(name)}_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    if data["spans"]:
+        metric = f"{prefix}_span_seconds"
+        lines.append(f"# TYPE {metric} summary")
+        for name, stats in sorted(data["spans"].items()):
+            lines.append(f'{metric}_count{{span="{name}"}} {stats["count"]}')
+            lines.append(f'{metric}_sum{{span="{name}"}} {stats["total_ms"] / 1000:.6f}')
+    return "\n".join(lines) + "\n"
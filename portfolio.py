@@ -1,32 +1,52 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
 import os
-try:
-    import yfinance as yf
-    yfinance_available = True
-except ImportError:
-    yfinance_available = False
-    st.error("yfinance not installed. Install with `pip install yfinance` for real-time prices.")
-
-# Initialize dictionaries for current and sold portfolios
-current_portfolio = {
-    "stock_name": [],
-    "stock_pur_price": [],
-    "stock_cur_price": [],
-    "quantity": [],
-    "profit_loss": [],
-    "percent_profit_loss": []
-}
+import uuid
+from datetime import date, timedelta
+import metrics
+from holdings import Portfolio, SoldPortfolio, FIFO, LIFO, AVERAGE
+from analytics import risk_report
+from feed import EngineSource, PriceFeed, ReplaySource
+from charts import TOP_N, chart_data, render_png, vega_lite_specs
+from history import HistoryStore, NIFTY100, portfolio_timeseries
+from ledger import Ledger, import_legacy_csvs
+from snapshot import to_csv
+from storage import DEFAULT_BOOK, book_directory
+from scenarios import holding_betas, monte_carlo, parse_moves, price_shock, read_sectors
+from prices import PriceEngine, YFinanceProvider, StaticPriceProvider, FilePriceProvider, FileHistoryProvider, yfinance_available
 
-sold_portfolio = {
-    "stock_name": [],
-    "stock_pur_price": [],
-    "stock_sold_price": [],
-    "quantity": [],
-    "booked_profit_loss": [],
-    "percent_booked_profit_loss": []
-}
+# Seconds a fetched price stays fresh; set PORTFOLIO_PRICE_FILE to price from a local file instead of yfinance
+PRICE_TTL_SECONDS = 60
+PRICE_FILE = os.environ.get("PORTFOLIO_PRICE_FILE")
+
+# Seconds between live price polls shared by all sessions (0 turns the feed off); polls go through the
+# price cache, so a shorter interval than PRICE_TTL_SECONDS does not fetch more often.
+# PORTFOLIO_REPLAY_FILE (timestamp,ticker,price CSV) replays recorded ticks instead of polling
+FEED_INTERVAL = float(os.environ.get("PORTFOLIO_FEED_INTERVAL", PRICE_TTL_SECONDS))
+REPLAY_FILE = os.environ.get("PORTFOLIO_REPLAY_FILE")
+
+# Directory holding the default book's ledger, its snapshots and any legacy CSVs to import;
+# other books live in DATA_DIR/books/<name>
+DATA_DIR = os.environ.get("PORTFOLIO_DATA_DIR", ".")
+ledger = None
+
+# Daily close history shared by every book; PORTFOLIO_HISTORY_FILE (date,ticker,close CSV) replaces yfinance offline
+HISTORY_DIR = os.path.join(DATA_DIR, "price_history")
+HISTORY_FILE = os.environ.get("PORTFOLIO_HISTORY_FILE")
+
+# Optional ticker,sector CSV for sector shocks; worker processes for Monte Carlo (1 runs in-process)
+SECTOR_FILE = os.environ.get("PORTFOLIO_SECTOR_FILE")
+SIM_WORKERS = int(os.environ.get("PORTFOLIO_SIM_WORKERS", "1"))
+
+# Current and sold portfolios; derived P&L columns and totals are cached inside each table
+current_portfolio = Portfolio()
+sold_portfolio = SoldPortfolio()
+
+# What the page shows: the current portfolio marked with live ticks, never recorded to the ledger
+live_portfolio = current_portfolio
+
+# Lot matching choices offered when selling
+LOT_METHOD_LABELS = {"FIFO": FIFO, "LIFO": LIFO, "Average Cost": AVERAGE}
 
 # NIFTY 100 index data for April 2025 from search results
 nifty100_data = {
@@ -50,185 +70,290 @@ known_prices = {
     "ITC": 410.10
 }
 
-def load_portfolios():
-    """Load existing portfolios from CSV files, handling missing columns and empty data."""
-    global current_portfolio, sold_portfolio
-    required_current_columns = ["stock_name", "stock_pur_price", "stock_cur_price", "quantity", "profit_loss"]
-    required_sold_columns = ["stock_name", "stock_pur_price", "stock_sold_price", "quantity", "booked_profit_loss"]
+@st.cache_resource
+def get_price_engine():
+    """Build the price engine once per server so its cache survives reruns and is shared across sessions."""
+    live = FilePriceProvider(PRICE_FILE) if PRICE_FILE else YFinanceProvider()
+    return PriceEngine([live, StaticPriceProvider(known_prices)], ttl=PRICE_TTL_SECONDS)
 
-    # Load current portfolio
-    if os.path.exists("current_portfolio.csv"):
-        try:
-            df = pd.read_csv("current_portfolio.csv")
-            if not df.empty and all(col in df.columns for col in required_current_columns):
-                df = df[df["stock_name"] != "Total"]
-                if not df.empty:
-                    # Load required columns
-                    current_portfolio["stock_name"] = df["stock_name"].tolist()
-                    current_portfolio["stock_pur_price"] = df["stock_pur_price"].tolist()
-                    current_portfolio["stock_cur_price"] = df["stock_cur_price"].tolist()
-                    current_portfolio["quantity"] = df["quantity"].astype(int).tolist()
-                    current_portfolio["profit_loss"] = df["profit_loss"].tolist()
-                    # Handle percent_profit_loss
-                    if "percent_profit_loss" in df.columns:
-                        current_portfolio["percent_profit_loss"] = df["percent_profit_loss"].tolist()
-                    else:
-                        # Verify lists are non-empty and equal length
-                        if (len(current_portfolio["stock_cur_price"]) > 0 and
-                            len(current_portfolio["stock_cur_price"]) == len(current_portfolio["stock_pur_price"])):
-                            current_portfolio["percent_profit_loss"] = [
-                                ((cur - pur) / pur * 100) if pur > 0 else 0
-                                for cur, pur in zip(current_portfolio["stock_cur_price"], current_portfolio["stock_pur_price"])
-                            ]
-                        else:
-                            current_portfolio["percent_profit_loss"] = [0] * len(current_portfolio["stock_name"])
-                else:
-                    st.warning("current_portfolio.csv contains only 'Total' row or is empty. Starting with empty portfolio.")
-                    current_portfolio = {k: [] for k in current_portfolio}
-            else:
-                st.warning("current_portfolio.csv is empty or missing required columns. Starting with empty portfolio.")
-                current_portfolio = {k: [] for k in current_portfolio}
-        except Exception as e:
-            st.warning(f"Error loading current_portfolio.csv: {e}. Starting with empty portfolio.")
-            current_portfolio = {k: [] for k in current_portfolio}
-    
-    # Load sold portfolio
-    if os.path.exists("sold_portfolio.csv"):
-        try:
-            df = pd.read_csv("sold_portfolio.csv")
-            if not df.empty and all(col in df.columns for col in required_sold_columns):
-                df = df[df["stock_name"] != "Total"]
-                if not df.empty:
-                    # Load required columns
-                    sold_portfolio["stock_name"] = df["stock_name"].tolist()
-                    sold_portfolio["stock_pur_price"] = df["stock_pur_price"].tolist()
-                    sold_portfolio["stock_sold_price"] = df["stock_sold_price"].tolist()
-                    sold_portfolio["quantity"] = df["quantity"].astype(int).tolist()
-                    sold_portfolio["booked_profit_loss"] = df["booked_profit_loss"].tolist()
-                    # Handle percent_booked_profit_loss
-                    if "percent_booked_profit_loss" in df.columns:
-                        sold_portfolio["percent_booked_profit_loss"] = df["percent_booked_profit_loss"].tolist()
-                    else:
-                        # Verify lists are non-empty and equal length
-                        if (len(sold_portfolio["stock_sold_price"]) > 0 and
-                            len(sold_portfolio["stock_sold_price"]) == len(sold_portfolio["stock_pur_price"])):
-                            sold_portfolio["percent_booked_profit_loss"] = [
-                                ((sold - pur) / pur * 100) if pur > 0 else 0
-                                for sold, pur in zip(sold_portfolio["stock_sold_price"], sold_portfolio["stock_pur_price"])
-                            ]
-                        else:
-                            sold_portfolio["percent_booked_profit_loss"] = [0] * len(sold_portfolio["stock_name"])
-                else:
-                    st.warning("sold_portfolio.csv contains only 'Total' row or is empty. Starting with empty portfolio.")
-                    sold_portfolio = {k: [] for k in sold_portfolio}
-            else:
-                st.warning("sold_portfolio.csv is empty or missing required columns. Starting with empty portfolio.")
-                sold_portfolio = {k: [] for k in sold_portfolio}
-        except Exception as e:
-            st.warning(f"Error loading sold_portfolio.csv: {e}. Starting with empty portfolio.")
-            sold_portfolio = {k: [] for k in sold_portfolio}
-
-def save_portfolios():
-    """Save current and sold portfolios to CSV files with totals and percentages."""
-    current_df = pd.DataFrame(current_portfolio)
-    if not current_df.empty:
-        current_df[["stock_pur_price", "stock_cur_price", "profit_loss", "percent_profit_loss"]] = current_df[
-            ["stock_pur_price", "stock_cur_price", "profit_loss", "percent_profit_loss"]
-        ].round(2)
-        current_df["current_value"] = current_df["stock_cur_price"] * current_df["quantity"]
-        total_value = current_df["current_value"].sum()
-        total_profit_loss = current_df["profit_loss"].sum()
-        current_df["investment"] = current_df["stock_pur_price"] * current_df["quantity"]
-        total_investment = current_df["investment"].sum()
-        total_percent_profit_loss = (total_profit_loss / total_investment * 100) if total_investment > 0 else 0
-        total_row = pd.DataFrame({
-            "stock_name": ["Total"],
-            "stock_pur_price": [None],
-            "stock_cur_price": [None],
-            "quantity": [None],
-            "profit_loss": [total_profit_loss],
-            "percent_profit_loss": [total_percent_profit_loss],
-            "current_value": [total_value]
-        })
-        current_df = pd.concat([current_df, total_row], ignore_index=True)
-        current_df.to_csv("current_portfolio.csv", index=False)
-    
-    sold_df = pd.DataFrame(sold_portfolio)
-    if not sold_df.empty:
-        sold_df[["stock_pur_price", "stock_sold_price", "booked_profit_loss", "percent_booked_profit_loss"]] = sold_df[
-            ["stock_pur_price", "stock_sold_price", "booked_profit_loss", "percent_booked_profit_loss"]
-        ].round(2)
-        total_booked_profit_loss = sold_df["booked_profit_loss"].sum()
-        sold_df["investment"] = sold_df["stock_pur_price"] * sold_df["quantity"]
-        total_investment = sold_df["investment"].sum()
-        total_percent_booked_profit_loss = (total_booked_profit_loss / total_investment * 100) if total_investment > 0 else 0
-        total_row = pd.DataFrame({
-            "stock_name": ["Total"],
-            "stock_pur_price": [None],
-            "stock_sold_price": [None],
-            "quantity": [None],
-            "booked_profit_loss": [total_booked_profit_loss],
-            "percent_booked_profit_loss": [total_percent_booked_profit_loss]
-        })
-        sold_df = pd.concat([sold_df, total_row], ignore_index=True)
-        sold_df.to_csv("sold_portfolio.csv", index=False)
+@st.cache_resource
+def get_history_store():
+    """One history store per server; it re-reads its manifest when another process appends."""
+    return HistoryStore(HISTORY_DIR)
+
+@st.cache_resource
+def get_price_feed():
+    """Start the one background price feed of this server."""
+    source = ReplaySource(REPLAY_FILE) if REPLAY_FILE else EngineSource(get_price_engine())
+    return PriceFeed(source, interval=FEED_INTERVAL).start()
+
+def live_fragment(function):
+    """Rerun function on its own every FEED_INTERVAL seconds where this Streamlit has fragments."""
+    fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+    if fragment is None or not FEED_INTERVAL:
+        return function
+    return fragment(run_every=FEED_INTERVAL)(function)
 
+def get_history_provider():
+    return FileHistoryProvider(HISTORY_FILE) if HISTORY_FILE else YFinanceProvider()
+
+@metrics.timed("load_portfolios")
+def load_portfolios(book=DEFAULT_BOOK):
+    """Load a book's portfolios from the latest ledger snapshot plus the events recorded after it.
+
+    On first run, existing current_portfolio.csv/sold_portfolio.csv files are
+    imported into an initial snapshot; after that the CSVs are no longer read.
+    Use the Export CSV action to write them out again.
+    """
+    global current_portfolio, sold_portfolio, ledger
+    # Parsed tables live in session state and are reused until the stored book actually changes,
+    # so widget-only reruns skip disk I/O and keep each table's cached derived columns
+    session = st.session_state
+    directory = book_directory(DATA_DIR, book)
+    ledgers = session.setdefault("ledgers", {})
+    if directory not in ledgers:
+        os.makedirs(directory, exist_ok=True)
+        ledgers[directory] = Ledger(directory)
+    ledger = ledgers[directory]
+    if session.get("portfolio_signature") == ledger.signature():
+        metrics.count("book_session_hits")
+        current_portfolio, sold_portfolio = session["portfolios"]
+        return
+    metrics.count("book_session_misses")
+    try:
+        for problem in import_legacy_csvs(ledger):
+            st.warning(problem)
+        current_portfolio, sold_portfolio = ledger.load()
+    except Exception as e:
+        # Never fall back to an empty book here: the next trade would be recorded on top of it
+        st.error(f"Could not load book '{book}' from {directory}: {e}")
+        st.stop()
+    session["portfolios"] = (current_portfolio, sold_portfolio)
+    session["portfolio_signature"] = ledger.signature()
+
+def record_event(event_type, **fields):
+    """Append a trade or price mark to the ledger and apply it to the loaded portfolios.
+
+    Events other sessions recorded since this one loaded are applied first, so
+    the tables stay in step with the stored book.
+    """
+    event = ledger.record(current_portfolio, sold_portfolio, event_type, **fields)
+    # The in-memory tables already include the event, so the next rerun can reuse them as-is
+    st.session_state["portfolio_signature"] = ledger.signature()
+    return event
+
+def apply_live_prices():
+    """Point live_portfolio at a copy of the loaded book marked with the feed's latest ticks.
+
+    Ticks never touch current_portfolio, so the ledger, its snapshots and
+    Export CSV keep recorded prices; Refresh All Prices records them. The copy
+    is rebuilt when the stored book changes and otherwise repriced with only
+    the ticks that arrived since this session last looked. A tick older than
+    its ticker's last recorded price is never applied. Returns the number of
+    lots repriced.
+    """
+    global live_portfolio
+    if not FEED_INTERVAL:
+        live_portfolio = current_portfolio
+        return 0
+    session = st.session_state
+    store = get_price_feed().store
+    store.watch(session.setdefault("feed_watcher", uuid.uuid4().hex), current_portfolio.tickers())
+    signature = session["portfolio_signature"]
+    overlay = session.get("live_portfolio")
+    if overlay is None or overlay[0] != signature:
+        # A fresh copy carries recorded prices only, so replay every tick newer than them
+        overlay = session["live_portfolio"] = (signature, current_portfolio.copy())
+        session["feed_version"] = 0
+    live_portfolio = overlay[1]
+    # Ticks older than a ticker's last recorded price (e.g. a manual Update Price) are stale
+    changed, session["feed_version"] = store.since(session.get("feed_version", 0), ledger.marked)
+    return live_portfolio.reprice(changed)
+
+def book_version():
+    """Cache key for anything derived from the loaded book's current prices."""
+    return st.session_state["portfolio_signature"], st.session_state.get("feed_version", 0)
+
+def get_live_quotes(tickers):
+    """Fetch quotes for many tickers through the shared cached engine, warning on provider failures."""
+    engine = get_price_engine()
+    quotes, errors = engine.lookup(tickers)
+    for provider, error in errors.items():
+        st.warning(f"Failed to fetch prices from {provider}: {error}")
+    return quotes
+
+@metrics.timed("get_real_time_price")
 def get_real_time_price(ticker):
-    """Fetch real-time price using yfinance, return None if unavailable."""
-    if yfinance_available:
-        try:
-            stock = yf.Ticker(f"{ticker}.NS")
-            price = stock.history(period="1d")["Close"].iloc[-1]
-            return round(price, 2)
-        except Exception as e:
-            st.warning(f"Failed to fetch real-time price for {ticker}: {e}")
-            return None
+    """Fetch real-time price through the cached price engine, return None if unavailable."""
+    quote = get_live_quotes([ticker]).get(ticker)
+    if quote is not None and quote.source != StaticPriceProvider.name:
+        return quote.price
     return None
 
-def plot_portfolios(current_data, sold_data, nifty100_df):
-    """Create a dual-panel plot: current portfolio profit/loss, sold portfolio booked profit/loss, and NIFTY 100 trend."""
-    fig = plt.figure(figsize=(14, 10))
-    
-    ax1 = plt.subplot(2, 1, 1)
-    current_df = pd.DataFrame(current_data)
-    if not current_df.empty:
-        colors = ['green' if pl >= 0 else 'red' for pl in current_df["profit_loss"]]
-        ax1.bar(current_df["stock_name"], current_df["profit_loss"], color=colors, label="Unrealized Profit/Loss (₹)")
-        ax1.set_xlabel("Stock Name")
-        ax1.set_ylabel("Unrealized Profit/Loss (₹)")
-        ax1.set_title("Current Portfolio Unrealized Profit/Loss")
-        ax1.grid(True, axis="y", linestyle="--", alpha=0.7)
-        ax1.legend()
-    else:
-        ax1.text(0.5, 0.5, "No Current Portfolio Data", horizontalalignment="center", verticalalignment="center")
-        ax1.set_title("Current Portfolio Unrealized Profit/Loss")
-    
-    plt.xticks(rotation=45, ha="right")
-    
-    ax2 = plt.subplot(2, 1, 2)
-    sold_df = pd.DataFrame(sold_data)
-    if not sold_df.empty:
-        colors = ['green' if pl >= 0 else 'red' for pl in sold_df["booked_profit_loss"]]
-        ax2.bar(sold_df["stock_name"], sold_df["booked_profit_loss"], color=colors, label="Booked Profit/Loss (₹)", alpha=0.5)
-        ax2.set_xlabel("Stock Name")
-        ax2.set_ylabel("Booked Profit/Loss (₹)", color="black")
-        ax2.tick_params(axis="y", labelcolor="black")
-        ax2.grid(True, axis="y", linestyle="--", alpha=0.7)
-        ax2.legend(loc="upper left")
+def refresh_all_prices():
+    """Mark every current holding to market with one concurrent refresh and a single save."""
+    st.sidebar.subheader("Refresh All Prices")
+    if current_portfolio.empty:
+        st.sidebar.write("No stocks to refresh.")
+        return
+    # Report from the previous run's refresh, kept across the rerun that redraws the tables
+    report = st.session_state.pop("refresh_report", None)
+    if report:
+        updated, failures = report
+        if failures:
+            st.sidebar.warning("Could not refresh: " + ", ".join(f"{t} ({reason})" for t, reason in sorted(failures.items())))
+        st.sidebar.success(f"Updated prices for {updated} holding(s).")
+    if st.sidebar.button("Refresh All Prices"):
+        result = get_price_engine().refresh(current_portfolio.tickers())
+        # Only live quotes mark to market; the static table would overwrite prices with stale January closes
+        live = {t: q.price for t, q in result.quotes.items() if q.source != StaticPriceProvider.name}
+        failures = dict(result.failures)
+        failures.update((t, "no live price available") for t in result.quotes if t not in live)
+        if live:
+            record_event("reprice", prices=live)
+        updated = len(live)
+        st.session_state["refresh_report"] = (updated, failures)
+        st.experimental_rerun()
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def prepare_chart_data(chart_key, top_n, _current_data, _sold_data, _performance=None):
+    """Aggregated, Top-N bucketed chart data, cached per book/performance version and Top-N setting."""
+    return chart_data(_current_data.frame(), _sold_data.frame(), nifty100_df, _performance, top_n)
+
+@metrics.timed("visualization_section")
+def visualization_section(performance):
+    """Portfolio charts as a cached server-rendered image or as client-side Vega-Lite charts."""
+    st.header("Portfolio Visualization")
+    col1, col2 = st.columns(2)
+    mode = col1.radio("Chart Mode", ["Image", "Interactive"], horizontal=True)
+    top_n = col2.number_input("Stocks Shown (rest grouped as Others)", min_value=5, max_value=100, value=TOP_N, step=5)
+    chart_key = book_version()
+    if performance is not None:
+        chart_key = (chart_key, get_history_store().signature(), performance.index[0], performance.index[-1])
+    data = prepare_chart_data(chart_key, int(top_n), live_portfolio, sold_portfolio, performance)
+    if mode == "Interactive":
+        for df, spec in vega_lite_specs(data):
+            st.vega_lite_chart(df, spec, use_container_width=True)
     else:
-        ax2.text(0.5, 0.5, "No Sold Portfolio Data", horizontalalignment="center", verticalalignment="center")
-    
-    ax3 = ax2.twinx()
-    ax3.plot(nifty100_df["date"], nifty100_df["price"], color="blue", marker="o", label="NIFTY 100")
-    ax3.set_ylabel("NIFTY 100 Index (₹)", color="blue")
-    ax3.tick_params(axis="y", labelcolor="blue")
-    ax3.legend(loc="upper right")
+        st.image(render_png(data))
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def compute_performance(signature, history_signature, start, end, _current_data):
+    """Daily performance of the current book vs. NIFTY 100, cached per book and history version."""
+    return portfolio_timeseries(_current_data, get_history_store(), start, end)
+
+@metrics.timed("performance_section")
+def performance_section():
+    """Date-range performance vs. NIFTY 100 from the local price history; returns the frame drawn, if any."""
+    st.header("Performance vs. NIFTY 100")
+    store = get_history_store()
+    today = date.today()
+    col1, col2 = st.columns(2)
+    start = col1.date_input("From", today - timedelta(days=365), key="history_start")
+    end = col2.date_input("To", today, key="history_end")
+    if st.button("Update Price History"):
+        # Backfills a year for new tickers in one bulk call; afterwards only missing days are fetched
+        try:
+            written = store.update(get_history_provider(), current_portfolio.tickers() + [NIFTY100], end=today)
+            st.success(f"Stored {written} new daily close(s).")
+        except Exception as e:
+            st.warning(f"Failed to update price history: {e}")
+    performance = compute_performance(st.session_state["portfolio_signature"], store.signature(), start, end, current_portfolio)
+    if performance.empty:
+        st.write("No price history for the current holdings yet. Use Update Price History to download it.")
+        return None
+    last = performance.iloc[-1]
+    st.write(f"**Portfolio Return**: {last['cum_return'] * 100:.2f}%")
+    if "benchmark_cum_return" in performance:
+        st.write(f"**NIFTY 100 Return**: {last['benchmark_cum_return'] * 100:.2f}%")
+        st.write(f"**Relative to NIFTY 100**: {last['relative'] * 100:.2f}%")
+    st.write(f"**Max Drawdown**: {performance['drawdown'].min() * 100:.2f}%")
+    return performance
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def compute_risk(signature, history_signature, start, end, confidence, window, _current_data):
+    """Risk report for the current book, cached per book, history version and parameters."""
+    return risk_report(_current_data, get_history_store(), start, end, confidence, window)
+
+@metrics.timed("risk_section")
+def risk_section():
+    """Volatility, beta, VaR and correlation over the Performance date range."""
+    st.header("Risk Analytics")
+    col1, col2 = st.columns(2)
+    confidence = col1.selectbox("VaR Confidence", [0.95, 0.99], format_func=lambda c: f"{c:.0%}")
+    window = col2.number_input("Rolling Volatility Window (days)", min_value=5, max_value=250, value=20, step=1)
+    report = compute_risk(
+        book_version(), get_history_store().signature(),
+        st.session_state["history_start"], st.session_state["history_end"], confidence, int(window), live_portfolio
+    )
+    if report is None:
+        st.write("Not enough price history for the current holdings to compute risk.")
+        return
+    st.write(f"**Annualized Volatility**: {report['volatility'] * 100:.2f}% over {report['days']} trading days")
+    st.write(f"**Beta vs. NIFTY 100**: {report['beta']:.2f}")
+    st.write(f"**1-Day Historical VaR ({confidence:.0%})**: ₹{report['historical_var_value']:,.2f} ({report['historical_var'] * 100:.2f}%)")
+    st.write(f"**1-Day Parametric VaR ({confidence:.0%})**: ₹{report['parametric_var_value']:,.2f} ({report['parametric_var'] * 100:.2f}%)")
+    st.dataframe(report["holdings"].round(4))
+    st.subheader("Correlation Matrix")
+    st.dataframe(report["correlation"].round(2))
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def compute_betas(signature, history_signature, start, end, _current_data):
+    """Per-holding beta vs. NIFTY 100 used to scale market shocks, cached per book and history version."""
+    return holding_betas(_current_data, get_history_store(), start, end)
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def compute_monte_carlo(signature, history_signature, start, end, paths, horizon, _current_data):
+    """Simulated P&L distribution, cached per book, history version and parameters."""
+    return monte_carlo(_current_data, get_history_store(), start, end, paths, horizon, workers=SIM_WORKERS)
+
+@metrics.timed("scenario_section")
+def scenario_section():
+    """What-if price shocks and a Monte Carlo P&L distribution for the current book."""
+    st.header("What-If Scenarios")
+    if current_portfolio.empty:
+        st.write("No stocks in current portfolio.")
+        return
+    history_signature = get_history_store().signature()
+    start, end = st.session_state["history_start"], st.session_state["history_end"]
     
-    ax2.set_title("Sold Portfolio Booked Profit/Loss vs. NIFTY 100 Trend (April 2025)")
-    plt.xticks(rotation=45, ha="right")
-    fig.tight_layout()
+    st.subheader("Price Shock")
+    col1, col2 = st.columns(2)
+    market_move = col1.number_input("NIFTY 100 Move (%)", min_value=-100.0, max_value=100.0, value=-10.0, step=1.0)
+    ticker_text = col2.text_input("Stock Moves (%), e.g. TCS:-5, INFY:3", "")
+    sectors, sector_text = {}, ""
+    if SECTOR_FILE:
+        sectors = read_sectors(SECTOR_FILE)
+        sector_text = st.text_input("Sector Moves (%), e.g. IT:-8, BANKS:2", "")
+    try:
+        ticker_moves, sector_moves = parse_moves(ticker_text), parse_moves(sector_text)
+    except ValueError as e:
+        st.warning(str(e))
+        return
+    betas_by_ticker = compute_betas(book_version(), history_signature, start, end, live_portfolio)
+    holdings, totals = price_shock(live_portfolio, market_move, ticker_moves, sector_moves, sectors, betas_by_ticker)
+    st.write(f"**Shocked Value**: ₹{totals['shocked_value']:,.2f} (change ₹{totals['change']:,.2f})")
+    st.write(f"**Shocked Unrealized Profit/Loss**: ₹{totals['shocked_profit_loss']:,.2f}")
+    st.caption("Market moves are scaled by each stock's beta vs. NIFTY 100; stocks without price history use a beta of 1.")
+    st.dataframe(holdings.round(2))
     
-    return fig
+    st.subheader("Monte Carlo")
+    col1, col2 = st.columns(2)
+    paths = col1.selectbox("Simulated Paths", [10000, 100000], format_func=lambda n: f"{n:,}")
+    horizon = col2.number_input("Horizon (trading days)", min_value=1, max_value=252, value=21, step=1)
+    if st.button("Run Simulation"):
+        st.session_state["simulation"] = (paths, int(horizon))
+    if st.session_state.get("simulation") != (paths, int(horizon)):
+        return
+    result = compute_monte_carlo(book_version(), history_signature, start, end, paths, int(horizon), live_portfolio)
+    if result is None:
+        st.write("Not enough price history for the current holdings to simulate.")
+        return
+    st.write(f"**Expected Unrealized Profit/Loss**: ₹{result['mean']:,.2f} after {result['horizon']} trading days")
+    st.write(f"**Probability of Losing Value**: {result['probability_of_loss']:.1%}")
+    st.dataframe(result["percentiles"].round(2).rename("profit_loss"))
+    if result["unsimulated"]:
+        st.caption("Held at current value (no price history): " + ", ".join(result["unsimulated"]))
 
 def print_market_trends():
     """Return a summary of recent market trends based on Indian market data."""
@@ -243,76 +368,77 @@ def print_market_trends():
     return trends
 
 def remove_stock(portfolio_type="current"):
-    """Remove a stock from the current or sold portfolio."""
+    """Remove a stock from the current portfolio (all of its lots) or its first record from the sold portfolio."""
     if portfolio_type == "current":
         portfolio = current_portfolio
-        csv_file = "current_portfolio.csv"
         title = "Remove Stock from Current Portfolio"
     else:
         portfolio = sold_portfolio
-        csv_file = "sold_portfolio.csv"
         title = "Remove Stock from Sold Portfolio"
     
-    df = pd.DataFrame(portfolio)
-    if df.empty:
+    if portfolio.empty:
         st.sidebar.write(f"No stocks to remove from {portfolio_type} portfolio.")
         return
     
     st.sidebar.subheader(title)
-    stock_options = df["stock_name"].tolist()
+    stock_options = portfolio.tickers()
     name = st.sidebar.selectbox(f"Select Stock to Remove from {portfolio_type.capitalize()} Portfolio", stock_options)
     
     if st.sidebar.button(f"Remove {portfolio_type.capitalize()} Stock"):
-        idx = portfolio["stock_name"].index(name)
-        for key in portfolio:
-            portfolio[key].pop(idx)
-        
-        save_portfolios()
-        st.sidebar.success(f"Removed {name} from {portfolio_type} portfolio.")
-        st.experimental_rerun()
+        try:
+            record_event("remove", portfolio=portfolio_type, stock_name=name)
+        except KeyError:
+            st.sidebar.error(f"{name} is no longer in the {portfolio_type} portfolio.")
+        else:
+            st.sidebar.success(f"Removed {name} from {portfolio_type} portfolio.")
+            st.experimental_rerun()
+
+@live_fragment
+def current_portfolio_section():
+    """Current holdings and totals; reruns alone on each feed interval to pick up live ticks."""
+    with metrics.span("current_portfolio_section"):
+        apply_live_prices()
+        st.header("Current Portfolio")
+        if not live_portfolio.empty:
+            st.dataframe(live_portfolio.frame())
+            totals = live_portfolio.totals()
+            st.write(f"**Total Current Value**: ₹{totals['current_value']:,.2f}")
+            st.write(f"**Total Unrealized Profit/Loss**: ₹{totals['profit_loss']:,.2f}")
+            st.write(f"**Total % Unrealized Profit/Loss**: {totals['percent_profit_loss']:.2f}%")
+            if FEED_INTERVAL and get_price_feed().error:
+                st.caption(f"Live prices unavailable: {get_price_feed().error}")
+        else:
+            st.write("No stocks in current portfolio.")
+
+def export_csv():
+    """Download buttons for both portfolios as CSV; the files are only built while this action is selected."""
+    st.sidebar.subheader("Export CSV")
+    st.sidebar.download_button("Download Current Portfolio", to_csv(current_portfolio), "current_portfolio.csv", "text/csv")
+    st.sidebar.download_button("Download Sold Portfolio", to_csv(sold_portfolio), "sold_portfolio.csv", "text/csv")
 
 def main():
     st.title("NIFTY 100 Stock Portfolio Tracker")
+    if not yfinance_available and not PRICE_FILE:
+        st.error("yfinance not installed. Install with `pip install yfinance` for real-time prices.")
     
-    load_portfolios()
+    # Each book has its own ledger directory, so users sharing a server do not write to one file
+    book = st.sidebar.text_input("Portfolio Book", DEFAULT_BOOK).strip() or DEFAULT_BOOK
+    load_portfolios(book)
     
     st.sidebar.header("Portfolio Actions")
-    action = st.sidebar.selectbox("Choose Action", ["Add Stock", "Sell Stock", "Update Price", "Remove Stock (Current)", "Remove Stock (Sold)"])
+    action = st.sidebar.selectbox("Choose Action", ["Add Stock", "Sell Stock", "Update Price", "Refresh All Prices", "Remove Stock (Current)", "Remove Stock (Sold)", "Export CSV"])
     
-    st.header("Current Portfolio")
-    current_df = pd.DataFrame(current_portfolio)
-    if not current_df.empty:
-        current_df[["stock_pur_price", "stock_cur_price", "profit_loss", "percent_profit_loss"]] = current_df[
-            ["stock_pur_price", "stock_cur_price", "profit_loss", "percent_profit_loss"]
-        ].round(2)
-        current_df["current_value"] = (current_df["stock_cur_price"] * current_df["quantity"]).round(2)
-        st.dataframe(current_df)
-        total_value = current_df["current_value"].sum()
-        total_profit_loss = current_df["profit_loss"].sum()
-        current_df["investment"] = current_df["stock_pur_price"] * current_df["quantity"]
-        total_investment = current_df["investment"].sum()
-        total_percent_profit_loss = (total_profit_loss / total_investment * 100) if total_investment > 0 else 0
-        st.write(f"**Total Current Value**: ₹{total_value:,.2f}")
-        st.write(f"**Total Unrealized Profit/Loss**: ₹{total_profit_loss:,.2f}")
-        st.write(f"**Total % Unrealized Profit/Loss**: {total_percent_profit_loss:.2f}%")
-    else:
-        st.write("No stocks in current portfolio.")
+    current_portfolio_section()
     
-    st.header("Sold Portfolio")
-    sold_df = pd.DataFrame(sold_portfolio)
-    if not sold_df.empty:
-        sold_df[["stock_pur_price", "stock_sold_price", "booked_profit_loss", "percent_booked_profit_loss"]] = sold_df[
-            ["stock_pur_price", "stock_sold_price", "booked_profit_loss", "percent_booked_profit_loss"]
-        ].round(2)
-        st.dataframe(sold_df)
-        total_booked_profit_loss = sold_df["booked_profit_loss"].sum()
-        sold_df["investment"] = sold_df["stock_pur_price"] * sold_df["quantity"]
-        total_investment = sold_df["investment"].sum()
-        total_percent_booked_profit_loss = (total_booked_profit_loss / total_investment * 100) if total_investment > 0 else 0
-        st.write(f"**Total Booked Profit/Loss**: ₹{total_booked_profit_loss:,.2f}")
-        st.write(f"**Total % Booked Profit/Loss**: {total_percent_booked_profit_loss:.2f}%")
-    else:
-        st.write("No stocks in sold portfolio.")
+    with metrics.span("portfolio_tables"):
+        st.header("Sold Portfolio")
+        if not sold_portfolio.empty:
+            st.dataframe(sold_portfolio.frame())
+            totals = sold_portfolio.totals()
+            st.write(f"**Total Booked Profit/Loss**: ₹{totals['booked_profit_loss']:,.2f}")
+            st.write(f"**Total % Booked Profit/Loss**: {totals['percent_booked_profit_loss']:.2f}%")
+        else:
+            st.write("No stocks in sold portfolio.")
     
     if action == "Add Stock":
         st.sidebar.subheader("Add New Stock")
@@ -320,7 +446,7 @@ def main():
         pur_price = st.sidebar.number_input("Purchase Price per Share (₹)", min_value=0.0, step=0.01, value=0.0, format="%.2f")
         
         default_price = known_prices.get(name, 0.0)
-        if yfinance_available and name:
+        if name:
             real_time_price = get_real_time_price(name)
             if real_time_price:
                 default_price = real_time_price
@@ -336,74 +462,47 @@ def main():
             if not name:
                 st.sidebar.error("Stock name cannot be empty.")
             else:
-                p_l = (cur_price - pur_price) * qty
-                percent_p_l = ((cur_price - pur_price) / pur_price * 100) if pur_price > 0 else 0
-                current_portfolio["stock_name"].append(name)
-                current_portfolio["stock_pur_price"].append(pur_price)
-                current_portfolio["stock_cur_price"].append(cur_price)
-                current_portfolio["quantity"].append(qty)
-                current_portfolio["profit_loss"].append(p_l)
-                current_portfolio["percent_profit_loss"].append(percent_p_l)
-                
-                save_portfolios()
+                record_event("add", stock_name=name, stock_pur_price=pur_price, stock_cur_price=cur_price, quantity=qty)
                 st.sidebar.success(f"Added {name} to portfolio.")
                 st.experimental_rerun()
     
     elif action == "Sell Stock":
         st.sidebar.subheader("Sell Stock")
-        if current_df.empty:
+        if current_portfolio.empty:
             st.sidebar.write("No stocks to sell.")
         else:
-            stock_options = current_df["stock_name"].tolist()
+            stock_options = current_portfolio.tickers()
             name = st.sidebar.selectbox("Select Stock to Sell", stock_options)
-            idx = current_portfolio["stock_name"].index(name)
-            max_qty = current_portfolio["quantity"][idx]
+            max_qty = current_portfolio.quantity_held(name)
             qty = st.sidebar.number_input("Quantity to Sell", min_value=1, max_value=max_qty, step=1, value=1, format="%d")
             sold_price = st.sidebar.number_input("Sold Price per Share (₹)", min_value=0.0, step=0.01, value=0.0, format="%.2f")
+            method = st.sidebar.selectbox("Lot Matching", list(LOT_METHOD_LABELS))
             
             if st.sidebar.button("Sell Stock"):
-                pur_price = current_portfolio["stock_pur_price"][idx]
-
-                booked_p_l = (sold_price - pur_price) * qty
-                percent_booked_p_l = ((sold_price - pur_price) / pur_price * 100) if pur_price > 0 else 0
-                
-                if qty == current_portfolio["quantity"][idx]:
-                    for key in current_portfolio:
-                        current_portfolio[key].pop(idx)
+                try:
+                    record_event("sell", stock_name=name, quantity=qty, stock_sold_price=sold_price,
+                                 method=LOT_METHOD_LABELS[method])
+                except (KeyError, ValueError) as e:
+                    # Another session may have sold these shares since this page loaded
+                    st.sidebar.error(f"Could not sell {name}: {e}")
                 else:
-                    current_portfolio["quantity"][idx] -= qty
-                    current_portfolio["profit_loss"][idx] = (
-                        current_portfolio["stock_cur_price"][idx] - current_portfolio["stock_pur_price"][idx]
-                    ) * current_portfolio["quantity"][idx]
-                    current_portfolio["percent_profit_loss"][idx] = (
-                        (current_portfolio["stock_cur_price"][idx] - current_portfolio["stock_pur_price"][idx]) / current_portfolio["stock_pur_price"][idx] * 100
-                    ) if current_portfolio["stock_pur_price"][idx] > 0 else 0
-                
-                sold_portfolio["stock_name"].append(name)
-                sold_portfolio["stock_pur_price"].append(current_portfolio["stock_pur_price"][idx])
-                sold_portfolio["stock_sold_price"].append(sold_price)
-                sold_portfolio["quantity"].append(qty)
-                sold_portfolio["booked_profit_loss"].append(booked_p_l)
-                sold_portfolio["percent_booked_profit_loss"].append(percent_booked_p_l)
-                
-                save_portfolios()
-                st.sidebar.success(f"Sold {qty} shares of {name}.")
-                st.experimental_rerun()
+                    st.sidebar.success(f"Sold {qty} shares of {name}.")
+                    st.experimental_rerun()
     
     elif action == "Update Price":
         st.sidebar.subheader("Update Stock Price")
-        if current_df.empty:
+        if current_portfolio.empty:
             st.sidebar.write("No stocks to update.")
         else:
-            stock_options = current_df["stock_name"].tolist()
+            stock_options = current_portfolio.tickers()
             name = st.sidebar.selectbox("Select Stock to Update", stock_options)
-            idx = current_portfolio["stock_name"].index(name)
             default_price = known_prices.get(name, 0.0)
-            if yfinance_available:
-                real_time_price = get_real_time_price(name)
-                if real_time_price:
-                    default_price = real_time_price
-                    st.sidebar.write(f"Real-time price for {name}: ₹{default_price}")
+            # One bulk fetch for every holding per TTL window; switching the selectbox then hits the cache
+            get_live_quotes(stock_options)
+            real_time_price = get_real_time_price(name)
+            if real_time_price:
+                default_price = real_time_price
+                st.sidebar.write(f"Real-time price for {name}: ₹{default_price}")
             
             cur_price = st.sidebar.number_input(
                 f"New Current Price per Share (₹) [Known price for {name}: ₹{default_price} as of Jan 31, 2025]" if name in known_prices else "New Current Price per Share (₹)",
@@ -411,30 +510,52 @@ def main():
             )
             
             if st.sidebar.button("Update Price"):
-                current_portfolio["stock_cur_price"][idx] = cur_price
-                current_portfolio["profit_loss"][idx] = (
-                    cur_price - current_portfolio["stock_pur_price"][idx]
-                ) * current_portfolio["quantity"][idx]
-                current_portfolio["percent_profit_loss"][idx] = (
-                    (cur_price - current_portfolio["stock_pur_price"][idx]) / current_portfolio["stock_pur_price"][idx] * 100
-                ) if current_portfolio["stock_pur_price"][idx] > 0 else 0
-                
-                save_portfolios()
+                record_event("reprice", prices={name: cur_price})
                 st.sidebar.success(f"Updated price for {name}.")
                 st.experimental_rerun()
     
+    elif action == "Refresh All Prices":
+        refresh_all_prices()
+    
     elif action == "Remove Stock (Current)":
         remove_stock(portfolio_type="current")
     
     elif action == "Remove Stock (Sold)":
         remove_stock(portfolio_type="sold")
     
-    st.header("Portfolio Visualization")
-    fig = plot_portfolios(current_portfolio, sold_portfolio, nifty100_df)
-    st.pyplot(fig)
+    elif action == "Export CSV":
+        export_csv()
+    
+    performance = performance_section()
+    risk_section()
+    scenario_section()
+    visualization_section(performance)
     
     st.header("Market Trends")
     st.markdown(print_market_trends())
 
+def performance_panel(spans, profile):
+    """Expandable timings for this rerun, server-wide counters and an optional cProfile of the next rerun."""
+    with st.expander("Performance"):
+        st.checkbox("Profile each rerun with cProfile", key="profile_rerun")
+        if profile.text:
+            st.text(profile.text)
+        if not metrics.enabled():
+            st.write("Set PORTFOLIO_METRICS=1 to record timings and counters.")
+            return
+        st.subheader("This Rerun")
+        st.dataframe(pd.DataFrame(spans, columns=["span", "ms"]).round(2))
+        data = metrics.snapshot()
+        st.subheader("Since Server Start")
+        st.dataframe(pd.DataFrame.from_dict(data["spans"], orient="index").round(2))
+        st.dataframe(pd.Series(data["counters"], name="count", dtype="int64"))
+        st.download_button("Download Prometheus Metrics", metrics.prometheus_text(), "portfolio_metrics.prom")
+
+def run():
+    """Run the page inside a metrics trace, profiled when requested, then show the Performance panel."""
+    with metrics.trace() as spans, metrics.profiled(st.session_state.get("profile_rerun", False)) as profile:
+        main()
+    performance_panel(spans, profile)
+
 if __name__ == "__main__":
-    main()
+    run()
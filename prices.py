@@ -0,0 +1,362 @@
+"""Price providers and a shared TTL/LRU price cache for NIFTY 100 tickers."""
+import importlib.util
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+
+import pandas as pd
+
+import metrics
+
+# yfinance is slow to import, so only check it is installed here and import it on the first live fetch
+yfinance_available = importlib.util.find_spec("yfinance") is not None
+
+# A cached price together with the backend that produced it
+Quote = namedtuple("Quote", ["price", "source"])
+
+# Outcome of a bulk refresh: {ticker: Quote} that were priced and {ticker: reason} that were not
+RefreshResult = namedtuple("RefreshResult", ["quotes", "failures"])
+
+# yfinance.download keeps each call's results in module globals that the next call clears,
+# so overlapping downloads from different threads can lose or mix results
+_yfinance_lock = threading.Lock()
+
+
+class PriceProvider:
+    """Base class for price backends: fetch many tickers in a single call.
+
+    Backends that must not be called from several threads at once set
+    thread_safe = False; PriceEngine.refresh then makes one bulk call.
+    """
+    name = "base"
+    available = True
+    thread_safe = True
+
+    def fetch_prices(self, tickers):
+        """Return {ticker: price} for the tickers this backend could price."""
+        raise NotImplementedError
+
+    def fetch_history(self, tickers, start, end):
+        """Return daily closes between start and end inclusive: a date index and one column per ticker.
+
+        Backends without history return an empty frame.
+        """
+        return pd.DataFrame()
+
+
+class YFinanceProvider(PriceProvider):
+    """Live NSE prices from yfinance, fetched for all tickers in one batched download.
+
+    yfinance parallelizes a download across symbols itself; downloads are
+    serialized process-wide because concurrent ones share its global state.
+    """
+    name = "yfinance"
+    thread_safe = False
+
+    def __init__(self, suffix=".NS", period="5d", timeout=10):
+        self.suffix = suffix
+        self.period = period
+        self.timeout = timeout
+        self.available = yfinance_available
+
+    def _symbol(self, ticker):
+        # Index symbols such as ^CNX100 are not exchange-suffixed
+        return ticker if ticker.startswith("^") else f"{ticker}{self.suffix}"
+
+    def _download_close(self, symbols, **kwargs):
+        import yfinance as yf
+        with _yfinance_lock:
+            data = yf.download(symbols, progress=False, threads=True, auto_adjust=False, timeout=self.timeout, **kwargs)
+        if data is None or data.empty:
+            return pd.DataFrame()
+        close = data["Close"]
+        if close.ndim == 1:
+            close = close.to_frame(symbols[0])
+        return close
+
+    def fetch_prices(self, tickers):
+        if not self.available or not tickers:
+            return {}
+        symbols = [self._symbol(ticker) for ticker in tickers]
+        close = self._download_close(symbols, period=self.period)
+        if close.empty:
+            # yfinance reports failed downloads (network errors included) as missing data, not exceptions
+            raise RuntimeError(f"no data returned for {', '.join(symbols)}")
+        # Last non-missing close per symbol, so holidays and thin trading still yield a price
+        last = close.ffill().iloc[-1]
+        prices = {}
+        for ticker, symbol in zip(tickers, symbols):
+            price = last.get(symbol)
+            if price is not None and price == price:
+                prices[ticker] = round(float(price), 2)
+        return prices
+
+
+    def fetch_history(self, tickers, start, end):
+        if not self.available or not tickers:
+            return pd.DataFrame()
+        symbols = [self._symbol(ticker) for ticker in tickers]
+        # yfinance treats end as exclusive
+        close = self._download_close(symbols, start=str(start), end=str(end + timedelta(days=1)))
+        close = close.rename(columns=dict(zip(symbols, tickers)))
+        close.index = pd.to_datetime(close.index).tz_localize(None).normalize()
+        return close
+
+
+class StaticPriceProvider(PriceProvider):
+    """Prices from a fixed in-memory table, such as the known January 2025 closes."""
+    name = "static"
+
+    def __init__(self, prices):
+        self.prices = dict(prices)
+
+    def fetch_prices(self, tickers):
+        return {ticker: self.prices[ticker] for ticker in tickers if ticker in self.prices}
+
+
+class FilePriceProvider(PriceProvider):
+    """Prices from a local JSON ({ticker: price}) or CSV (ticker,price) file, for offline use and tests."""
+    name = "file"
+
+    def __init__(self, path):
+        self.path = path
+        self._mtime = None
+        self._prices = {}
+
+    @property
+    def available(self):
+        return os.path.exists(self.path)
+
+    def _load(self):
+        mtime = os.path.getmtime(self.path)
+        if mtime == self._mtime:
+            return self._prices
+        if self.path.endswith(".json"):
+            with open(self.path) as f:
+                prices = {str(k).upper(): float(v) for k, v in json.load(f).items()}
+        else:
+            prices = {}
+            with open(self.path) as f:
+                for line in f:
+                    parts = [p.strip() for p in line.split(",")]
+                    if len(parts) < 2 or parts[0].lower() in ("ticker", "stock_name"):
+                        continue
+                    try:
+                        prices[parts[0].upper()] = float(parts[1])
+                    except ValueError:
+                        continue
+        self._prices, self._mtime = prices, mtime
+        return prices
+
+    def fetch_prices(self, tickers):
+        if not self.available:
+            return {}
+        prices = self._load()
+        return {ticker: prices[ticker] for ticker in tickers if ticker in prices}
+
+
+class FileHistoryProvider(PriceProvider):
+    """Daily closes from a local long-format CSV (date,ticker,close), for offline use and tests.
+
+    Current prices are the latest close per ticker.
+    """
+    name = "file_history"
+
+    def __init__(self, path):
+        self.path = path
+        self._mtime = None
+        self._closes = pd.DataFrame()
+
+    @property
+    def available(self):
+        return os.path.exists(self.path)
+
+    def _load(self):
+        mtime = os.path.getmtime(self.path)
+        if mtime != self._mtime:
+            df = pd.read_csv(self.path, parse_dates=["date"])
+            df["ticker"] = df["ticker"].str.upper()
+            self._closes = df.pivot_table(index="date", columns="ticker", values="close").sort_index()
+            self._mtime = mtime
+        return self._closes
+
+    def fetch_prices(self, tickers):
+        if not self.available:
+            return {}
+        closes = self._load()
+        if closes.empty:
+            return {}
+        last = closes.ffill().iloc[-1]
+        return {t: float(last[t]) for t in tickers if t in last.index and last[t] == last[t]}
+
+    def fetch_history(self, tickers, start, end):
+        if not self.available:
+            return pd.DataFrame()
+        closes = self._load()
+        closes = closes.loc[pd.Timestamp(start):pd.Timestamp(end), [t for t in tickers if t in closes.columns]]
+        return closes.dropna(how="all")
+
+
+class PriceCache:
+    """Thread-safe TTL cache with per-symbol staleness and LRU eviction."""
+
+    def __init__(self, ttl=60.0, maxsize=1024, clock=time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self._entries = OrderedDict()  # ticker -> (quote or None, fetched_at)
+        self._lock = threading.Lock()
+
+    def get_many(self, tickers):
+        """Split tickers into fresh cached quotes and tickers that need fetching.
+
+        A cached None is a remembered miss and counts as fresh, so unknown
+        tickers are not refetched on every rerun.
+        """
+        now = self.clock()
+        fresh, missing = {}, []
+        with self._lock:
+            for ticker in tickers:
+                entry = self._entries.get(ticker)
+                if entry is not None and now - entry[1] < self.ttl:
+                    self._entries.move_to_end(ticker)
+                    fresh[ticker] = entry[0]
+                else:
+                    missing.append(ticker)
+        metrics.count("price_cache_hits", len(fresh))
+        metrics.count("price_cache_misses", len(missing))
+        return fresh, missing
+
+    def put_many(self, quotes):
+        """Store {ticker: Quote or None}, evicting the least recently used symbols."""
+        now = self.clock()
+        with self._lock:
+            for ticker, quote in quotes.items():
+                self._entries[ticker] = (quote, now)
+                self._entries.move_to_end(ticker)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, tickers=None):
+        """Drop the given tickers, or everything when tickers is None."""
+        with self._lock:
+            if tickers is None:
+                self._entries.clear()
+            else:
+                for ticker in tickers:
+                    self._entries.pop(ticker, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class PriceEngine:
+    """Resolve prices for many tickers through a cache and an ordered chain of providers.
+
+    Cache misses are fetched in one bulk call per provider; tickers a provider
+    cannot price fall through to the next one.
+    """
+
+    def __init__(self, providers, ttl=60.0, maxsize=1024, clock=time.monotonic):
+        self.providers = list(providers)
+        self.cache = PriceCache(ttl=ttl, maxsize=maxsize, clock=clock)
+        self._fetch_lock = threading.Lock()
+
+    def _fetch(self, tickers):
+        """Run tickers through the provider chain, returning ({ticker: Quote or None}, {provider: error})."""
+        quotes, errors = {}, {}
+        pending = list(tickers)
+        for provider in self.providers:
+            if not pending or not provider.available:
+                continue
+            metrics.count("price_fetches")
+            try:
+                with metrics.span(f"price_fetch.{provider.name}"):
+                    prices = provider.fetch_prices(pending)
+            except Exception as e:
+                metrics.count("price_fetch_errors")
+                errors[provider.name] = str(e)
+                continue
+            for ticker, price in prices.items():
+                quotes[ticker] = Quote(price, provider.name)
+            pending = [ticker for ticker in pending if ticker not in quotes]
+        for ticker in pending:
+            quotes[ticker] = None
+        return quotes, errors
+
+    def lookup(self, tickers, force=False):
+        """Return ({ticker: Quote or None}, {provider: error}), fetching only stale or unseen tickers.
+
+        Errors are those of this call's fetch only; the engine is shared by
+        every session, so it keeps no error state of its own.
+        """
+        tickers = list(dict.fromkeys(t for t in tickers if t))
+        if force:
+            self.cache.invalidate(tickers)
+        fresh, missing = self.cache.get_many(tickers)
+        errors = {}
+        if missing:
+            with self._fetch_lock:
+                # Another session may have fetched these while we waited for the lock
+                refreshed, missing = self.cache.get_many(missing)
+                fresh.update(refreshed)
+                if missing:
+                    fetched, errors = self._fetch(missing)
+                    self.cache.put_many(fetched)
+                    fresh.update(fetched)
+        return fresh, errors
+
+    def get_quotes(self, tickers, force=False):
+        """Return {ticker: Quote or None}, fetching only stale or unseen tickers."""
+        return self.lookup(tickers, force=force)[0]
+
+    def get_prices(self, tickers, force=False):
+        """Return {ticker: price} for the tickers that could be priced."""
+        return {t: q.price for t, q in self.get_quotes(tickers, force=force).items() if q is not None}
+
+    def get_quote(self, ticker, force=False):
+        return self.get_quotes([ticker], force=force).get(ticker)
+
+    @metrics.timed("price_refresh")
+    def refresh(self, tickers, max_workers=8, chunk_size=10, timeout=15.0):
+        """Re-fetch every ticker concurrently, bypassing the cache.
+
+        Tickers are split into chunks fetched on a bounded thread pool, so a
+        full mark-to-market costs roughly one round trip. When a provider is
+        not thread-safe (yfinance) all tickers go in one bulk call instead,
+        which that provider parallelizes itself. Chunks that raise or do not
+        finish within timeout seconds are reported as failures instead of
+        failing the whole refresh.
+        """
+        tickers = list(dict.fromkeys(t for t in tickers if t))
+        if not all(provider.thread_safe for provider in self.providers if provider.available):
+            chunk_size = max(len(tickers), 1)
+        chunks = [tickers[i:i + chunk_size] for i in range(0, len(tickers), chunk_size)]
+        quotes, failures = {}, {}
+        if not chunks:
+            return RefreshResult(quotes, failures)
+        executor = ThreadPoolExecutor(max_workers=min(max_workers, len(chunks)))
+        try:
+            futures = {executor.submit(self._fetch, chunk): chunk for chunk in chunks}
+            done, not_done = wait(futures, timeout=timeout)
+            for future in done:
+                try:
+                    fetched, errors = future.result()
+                except Exception as e:
+                    failures.update((ticker, str(e)) for ticker in futures[future])
+                    continue
+                for ticker, quote in fetched.items():
+                    if quote is None:
+                        failures[ticker] = "; ".join(f"{k}: {v}" for k, v in errors.items()) or "no price available"
+                    else:
+                        quotes[ticker] = quote
+            for future in not_done:
+                failures.update((ticker, f"timed out after {timeout:g}s") for ticker in futures[future])
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        self.cache.put_many(quotes)
+        return RefreshResult(quotes, failures)
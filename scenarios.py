@@ -0,0 +1,141 @@
+"""What-if analysis of the current holdings: deterministic price shocks and Monte Carlo simulation of P&L."""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from analytics import betas, covariance, return_matrix
+
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+CHUNK_SIZE = 10000
+
+
+def _holding_values(current):
+    """Current value per ticker, lots summed."""
+    return current.frame().groupby("stock_name", sort=False)["current_value"].sum()
+
+
+def parse_moves(text):
+    """{key: percent} from text like "TCS:-5, INFY:+3"; raises ValueError naming the bad entry."""
+    moves = {}
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        key, sep, value = part.rpartition(":")
+        if not sep or not key.strip():
+            raise ValueError(f"Expected NAME:PERCENT, got '{part}'")
+        try:
+            moves[key.strip().upper()] = float(value)
+        except ValueError:
+            raise ValueError(f"Expected a number after ':' in '{part}'") from None
+    return moves
+
+
+def read_sectors(path):
+    """{ticker: sector} from a CSV with ticker,sector columns."""
+    df = pd.read_csv(path)
+    return dict(zip(df["ticker"].str.upper(), df["sector"].str.upper()))
+
+
+def holding_betas(current, store, start=None, end=None):
+    """Beta vs. NIFTY 100 per held ticker with stored history; others are left out."""
+    tickers = [ticker for ticker in current.tickers() if ticker in store.manifest]
+    if not tickers:
+        return pd.Series(dtype=np.float64)
+    matrix = return_matrix(store, tickers, start, end)
+    if len(matrix.returns) < 2:
+        return pd.Series(dtype=np.float64)
+    return pd.Series(betas(matrix.returns, matrix.benchmark), index=matrix.tickers).dropna()
+
+
+def price_shock(current, market_move=0.0, ticker_moves=None, sector_moves=None, sectors=None, beta_by_ticker=None):
+    """Revalue the book under percentage moves; returns (per-holding frame, totals dict).
+
+    Each holding moves by market_move scaled by its beta (1 where unknown),
+    plus its sector's move and its own ticker move, all in percent.
+    """
+    values = _holding_values(current)
+    tickers = values.index
+    beta = (beta_by_ticker if beta_by_ticker is not None else pd.Series(dtype=np.float64)).reindex(tickers).fillna(1.0)
+    sectors = sectors or {}
+    sector_move = pd.Series([(sector_moves or {}).get(sectors.get(t), 0.0) for t in tickers], index=tickers)
+    own_move = pd.Series([(ticker_moves or {}).get(t, 0.0) for t in tickers], index=tickers)
+    move = beta * market_move + sector_move + own_move
+    shocked = values * (1 + move / 100)
+    holdings = pd.DataFrame({
+        "beta": beta,
+        "move": move,
+        "current_value": values,
+        "shocked_value": shocked,
+        "change": shocked - values,
+    })
+    totals = current.totals()
+    change = float(holdings["change"].sum())
+    return holdings, {
+        "current_value": totals["current_value"],
+        "shocked_value": totals["current_value"] + change,
+        "change": change,
+        "profit_loss": totals["profit_loss"],
+        "shocked_profit_loss": totals["profit_loss"] + change,
+    }
+
+
+def _simulate_chunk(args):
+    """Total value change of each path in one chunk: correlated normal returns as one matrix product."""
+    seed, size, mean, factor, values = args
+    rng = np.random.default_rng(seed)
+    returns = rng.standard_normal((size, len(mean))) @ factor.T + mean
+    return returns @ values
+
+
+def _cholesky(cov):
+    """Cholesky factor, adding diagonal jitter when the sample covariance is only semi-definite."""
+    jitter = 0.0
+    scale = float(np.mean(np.diag(cov))) or 1.0
+    for _ in range(6):
+        try:
+            return np.linalg.cholesky(cov + np.eye(len(cov)) * jitter)
+        except np.linalg.LinAlgError:
+            jitter = scale * 1e-10 if jitter == 0.0 else jitter * 100
+    raise np.linalg.LinAlgError("Covariance matrix is not positive semi-definite")
+
+
+@metrics.timed("scenarios.monte_carlo")
+def monte_carlo(current, store, start=None, end=None, paths=100000, horizon=21, seed=0,
+                chunk_size=CHUNK_SIZE, workers=1, percentiles=PERCENTILES):
+    """Distribution of total unrealized profit/loss after horizon trading days, or None without enough history.
+
+    Horizon returns are drawn as multivariate normal with the historical daily
+    mean and covariance scaled by horizon. Paths are generated chunk_size at a
+    time (memory stays at chunk_size x holdings), on a process pool when
+    workers > 1; a given seed gives the same result for any worker count.
+    Holdings without stored history are held at their current value.
+    """
+    values = _holding_values(current)
+    simulated = values[[ticker in store.manifest for ticker in values.index]]
+    if simulated.empty:
+        return None
+    matrix = return_matrix(store, list(simulated.index), start, end)
+    if len(matrix.returns) < 2:
+        return None
+    mean = matrix.returns.mean(axis=0) * horizon
+    factor = _cholesky(covariance(matrix.returns) * horizon)
+    weights = simulated.to_numpy(dtype=np.float64)
+    sizes = [min(chunk_size, paths - i) for i in range(0, paths, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(s, size, mean, factor, weights) for s, size in zip(seeds, sizes)]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            changes = np.concatenate(list(pool.map(_simulate_chunk, tasks)))
+    else:
+        changes = np.concatenate([_simulate_chunk(task) for task in tasks])
+    profit_loss = current.totals()["profit_loss"] + changes
+    return {
+        "paths": paths,
+        "horizon": horizon,
+        "holdings": len(simulated),
+        "unsimulated": [ticker for ticker in values.index if ticker not in simulated.index],
+        "percentiles": pd.Series(np.percentile(profit_loss, percentiles), index=[f"P{p}" for p in percentiles]),
+        "mean": float(profit_loss.mean()),
+        "probability_of_loss": float((changes < 0).mean()),
+    }
+
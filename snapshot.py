@@ -0,0 +1,101 @@
+"""Typed columnar snapshot files: both portfolio tables in one uncompressed Arrow IPC (Feather v2) file.
+
+Schema version 1, one row per lot:
+    portfolio         dictionary<int8, string>   "current" or "sold"
+    stock_name        dictionary<int32, string>
+    stock_pur_price   float64
+    stock_cur_price   float64 (null on sold rows)
+    stock_sold_price  float64 (null on current rows)
+    quantity          int64
+The ledger sequence number and byte offset the snapshot covers, and when each
+ticker's price was last recorded, are stored in the schema metadata, so one
+atomic rename publishes tables and position together. Files are read through a memory map with no per-row type repair.
+pyarrow is imported on first use.
+"""
+import json
+
+import numpy as np
+
+from holdings import Portfolio, SoldPortfolio
+from storage import atomic_write
+
+SCHEMA_VERSION = 1
+CURRENT = "current"
+SOLD = "sold"
+
+
+def _schema(pa):
+    return pa.schema([
+        ("portfolio", pa.dictionary(pa.int8(), pa.string())),
+        ("stock_name", pa.dictionary(pa.int32(), pa.string())),
+        ("stock_pur_price", pa.float64()),
+        ("stock_cur_price", pa.float64()),
+        ("stock_sold_price", pa.float64()),
+        ("quantity", pa.int64()),
+    ])
+
+
+def write(path, current, sold, seq, offset, marked=None):
+    """Atomically replace path with a snapshot of both tables at ledger position (seq, offset).
+
+    marked is {ticker: epoch seconds} of each ticker's last recorded price.
+    """
+    import pyarrow as pa
+    n_current, n_sold = len(current), len(sold)
+    missing_current, missing_sold = np.full(n_sold, np.nan), np.full(n_current, np.nan)
+    kinds = pa.DictionaryArray.from_arrays(
+        pa.array(np.repeat(np.array([0, 1], dtype=np.int8), [n_current, n_sold])), pa.array([CURRENT, SOLD]))
+    names = pa.array(np.concatenate([current.col("stock_name"), sold.col("stock_name")]).astype(str),
+                     type=pa.string()).dictionary_encode()
+    columns = [
+        kinds,
+        names,
+        pa.array(np.concatenate([current.col("stock_pur_price"), sold.col("stock_pur_price")])),
+        pa.array(np.concatenate([current.col("stock_cur_price"), missing_current]), from_pandas=True),
+        pa.array(np.concatenate([missing_sold, sold.col("stock_sold_price")]), from_pandas=True),
+        pa.array(np.concatenate([current.col("quantity"), sold.col("quantity")]).astype(np.int64)),
+    ]
+    metadata = {"schema_version": str(SCHEMA_VERSION), "seq": str(seq), "offset": str(offset),
+                "marked": json.dumps(marked or {})}
+    table = pa.Table.from_arrays(columns, schema=_schema(pa).with_metadata(metadata))
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    atomic_write(path, sink.getvalue().to_pybytes())
+
+
+def _open(path):
+    """(table, metadata) of a snapshot file, checking its schema version."""
+    import pyarrow as pa
+    with pa.memory_map(path) as source:
+        table = pa.ipc.open_file(source).read_all()
+    metadata = {key.decode(): value.decode() for key, value in (table.schema.metadata or {}).items()}
+    version = int(metadata.get("schema_version", 0))
+    if version != SCHEMA_VERSION:
+        raise ValueError(f"{path} has snapshot schema version {version}, expected {SCHEMA_VERSION}")
+    return table, metadata
+
+
+def read(path):
+    """{"seq", "offset", "marked", "current", "sold"} with each table as {column: numpy array}."""
+    table, metadata = _open(path)
+    df = table.to_pandas()
+    is_current = (df["portfolio"] == CURRENT).to_numpy()
+    tables = {}
+    for kind, mask, table_cls in ((CURRENT, is_current, Portfolio), (SOLD, ~is_current, SoldPortfolio)):
+        rows = df[mask]
+        tables[kind] = {name: rows[name].to_numpy(dtype=dtype) for name, dtype in table_cls.columns.items()}
+    return {"seq": int(metadata["seq"]), "offset": int(metadata["offset"]),
+            "marked": json.loads(metadata.get("marked", "{}")), **tables}
+
+
+def read_tickers(path):
+    """(current tickers, ledger offset) of a snapshot, decoding only the ticker and portfolio columns."""
+    table, metadata = _open(path)
+    df = table.select(["portfolio", "stock_name"]).to_pandas()
+    return list(df.loc[df["portfolio"] == CURRENT, "stock_name"].unique()), int(metadata["offset"])
+
+
+def to_csv(table):
+    """A table's rows with derived P&L columns as CSV text, for export."""
+    return table.frame().to_csv(index=False)
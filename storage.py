@@ -0,0 +1,54 @@
+"""File primitives shared by the ledger and price history: advisory locks, atomic writes and book directories."""
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DEFAULT_BOOK = "default"
+
+# Serializes writers inside one process too: flock is per open file, so threads would not exclude each other
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive advisory lock on path (created if missing) for the duration of the block.
+
+    Only writers take it; readers rely on atomic renames and append-only logs
+    and never wait. Without fcntl (Windows) only threads of this process are
+    serialized.
+    """
+    key = os.path.abspath(path)
+    with _thread_locks_guard:
+        thread_lock = _thread_locks.setdefault(key, threading.Lock())
+    with thread_lock, open(path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def atomic_write(path, data):
+    """Replace path with data (str or bytes) so readers see either the old or the new file, never a partial one."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb" if isinstance(data, bytes) else "w") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def book_directory(root, book=DEFAULT_BOOK):
+    """Directory holding one book: the data root for the default book, root/books/<name> otherwise."""
+    if not book or book == DEFAULT_BOOK:
+        return root
+    return os.path.join(root, "books", re.sub(r"[^A-Za-z0-9_-]", "_", book))
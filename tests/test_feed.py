@@ -0,0 +1,80 @@
+from feed import EngineSource, PriceFeed, ReplaySource, TickStore
+from prices import PriceEngine, PriceProvider, StaticPriceProvider
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_replayed_ticks_reach_sessions_once(tmp_path):
+    path = tmp_path / "ticks.csv"
+    path.write_text("timestamp,ticker,price\n1,TCS,4000\n1,INFY,1500\n2,TCS,4010\n3,SBIN,800\n")
+    feed = PriceFeed(ReplaySource(str(path), loop=False))
+    feed.store.watch("session", ["TCS", "INFY"])
+
+    assert feed.poll_once() == 2
+    changed, version = feed.store.since(0)
+    assert changed == {"TCS": 4000.0, "INFY": 1500.0}
+    assert feed.poll_once() == 1
+    assert feed.store.since(version) == ({"TCS": 4010.0}, version + 1)
+    # SBIN is not watched, and the replay does not loop
+    assert feed.poll_once() == 0
+    assert feed.poll_once() == 0
+
+
+def test_ticks_older_than_a_recorded_price_are_stale():
+    clock = FakeClock()
+    store = TickStore(timestamp=clock)
+    store.publish({"TCS": 4000.0, "INFY": 1500.0})
+    clock.now += 10
+    # TCS was marked by hand after its tick; INFY's mark predates its tick
+    marked = {"TCS": clock.now - 5, "INFY": clock.now - 20}
+    assert store.since(0, marked)[0] == {"INFY": 1500.0}
+    clock.now += 10
+    store.publish({"TCS": 4020.0})
+    assert store.since(0, marked)[0] == {"TCS": 4020.0, "INFY": 1500.0}
+
+
+def test_watchers_expire():
+    clock = FakeClock()
+    store = TickStore(watch_ttl=60, clock=clock)
+    store.watch("a", ["TCS"])
+    store.watch("b", ["INFY", "TCS"])
+    assert store.watched() == ["TCS", "INFY"]
+    clock.now += 30
+    store.watch("b", ["INFY"])
+    clock.now += 40
+    assert store.watched() == ["INFY"]
+
+
+def test_engine_source_reports_provider_failures_until_live_prices_return():
+    class Flaky(PriceProvider):
+        name = "live"
+        failing = True
+
+        def fetch_prices(self, tickers):
+            if self.failing:
+                raise RuntimeError("no data returned")
+            return {ticker: 10.0 for ticker in tickers}
+
+    clock, live = FakeClock(), Flaky()
+    engine = PriceEngine([live, StaticPriceProvider({"TCS": 1.0})], ttl=60, clock=clock)
+    feed = PriceFeed(EngineSource(engine))
+    feed.store.watch("session", ["TCS"])
+
+    feed.poll_once()
+    assert feed.source.error == "live: no data returned"
+    # The static fallback is cached, and is neither a tick nor a recovery
+    clock.now += 30
+    assert feed.poll_once() == 0
+    assert feed.source.error == "live: no data returned"
+
+    live.failing = False
+    clock.now += 60
+    assert feed.poll_once() == 1
+    assert feed.source.error is None
+    assert feed.store.since(0)[0] == {"TCS": 10.0}
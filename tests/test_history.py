@@ -0,0 +1,66 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from history import NIFTY100, HistoryStore, portfolio_timeseries
+from holdings import Portfolio
+from prices import FileHistoryProvider
+
+
+def write_history(path, end, days=30):
+    dates = pd.bdate_range(end=end, periods=days)
+    rows = [(d.date(), ticker, 100.0 + i + offset)
+            for i, d in enumerate(dates) for offset, ticker in enumerate(["TCS", "INFY", NIFTY100])]
+    pd.DataFrame(rows, columns=["date", "ticker", "close"]).to_csv(path, index=False)
+    return dates
+
+
+def test_update_fetches_only_missing_completed_days(tmp_path):
+    today = date.today()
+    dates = write_history(tmp_path / "closes.csv", today)
+    store = HistoryStore(str(tmp_path / "store"))
+    provider = FileHistoryProvider(str(tmp_path / "closes.csv"))
+
+    written = store.update(provider, ["TCS", NIFTY100], end=today, backfill_days=60)
+    completed = [d for d in dates if d.date() < today]
+    assert written == 2 * len(completed)
+    assert store.last_day("TCS") == completed[-1].date()
+    assert store.update(provider, ["TCS", NIFTY100], end=today) == 0
+
+    # A new ticker is backfilled on its own
+    assert store.update(provider, ["TCS", "INFY"], end=today, backfill_days=60) == len(completed)
+    assert list(store.series("INFY").index) == completed
+
+
+def test_torn_append_is_cut_before_the_next_one(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    first = pd.bdate_range("2025-01-01", periods=5)
+    store.append(pd.DataFrame({"TCS": np.arange(5.0)}, index=first))
+    # A crash after writing the days file but before the closes file and manifest
+    days_path, _ = store._paths("TCS")
+    with open(days_path, "ab") as f:
+        f.write(np.array([99999, 99998], dtype=np.int32).tobytes())
+    assert len(store.series("TCS")) == 5
+
+    second = pd.bdate_range(first[-1] + timedelta(days=1), periods=3)
+    assert store.append(pd.DataFrame({"TCS": [10.0, 11.0, 12.0]}, index=second)) == 3
+    series = store.series("TCS")
+    assert list(series.index) == list(first) + list(second)
+    assert list(series) == [0.0, 1.0, 2.0, 3.0, 4.0, 10.0, 11.0, 12.0]
+
+
+def test_portfolio_timeseries_values_the_book_daily(tmp_path):
+    end = date.today() - timedelta(days=1)
+    write_history(tmp_path / "closes.csv", end, days=10)
+    store = HistoryStore(str(tmp_path / "store"))
+    store.update(FileHistoryProvider(str(tmp_path / "closes.csv")), ["TCS", "INFY", NIFTY100], end=end)
+    book = Portfolio()
+    book.add(["TCS", "INFY"], [100.0, 100.0], [100.0, 100.0], [2, 1])
+
+    result = portfolio_timeseries(book, store)
+    assert len(result) == 10
+    # TCS closes at 100 + day, INFY at 101 + day
+    assert list(result["value"]) == [2 * (100.0 + i) + (101.0 + i) for i in range(10)]
+    assert result["drawdown"].max() == 0.0
+    assert "relative" in result
@@ -0,0 +1,118 @@
+import pandas as pd
+import pytest
+
+from holdings import AVERAGE, FIFO, LIFO, Portfolio, SoldPortfolio
+
+
+def make_book():
+    """Two INFY lots (10 @ 100, then 5 @ 120) between TCS lots, added one trade at a time."""
+    book = Portfolio()
+    book.add("TCS", 3000.0, 3100.0, 2)
+    book.add("INFY", 100.0, 110.0, 10)
+    book.add("INFY", 120.0, 110.0, 5)
+    book.add("TCS", 3200.0, 3100.0, 1)
+    return book
+
+
+def lots(book, name):
+    frame = book.frame()
+    rows = frame[frame["stock_name"] == name]
+    return list(zip(rows["stock_pur_price"], rows["quantity"]))
+
+
+def rebuilt(book):
+    """The same rows in a fresh table, with nothing cached and nothing tombstoned."""
+    return Portfolio.from_columns({name: list(book.col(name)) for name in Portfolio.columns})
+
+
+def assert_same_book(book, expected):
+    pd.testing.assert_frame_equal(book.frame().reset_index(drop=True), expected.frame().reset_index(drop=True))
+    assert book.totals() == pytest.approx(expected.totals())
+
+
+def test_fifo_sell_consumes_oldest_lots_first():
+    book = make_book()
+    records = book.sell("INFY", 12, 130.0, FIFO)
+    assert records == {
+        "stock_name": ["INFY", "INFY"],
+        "stock_pur_price": [100.0, 120.0],
+        "stock_sold_price": [130.0, 130.0],
+        "quantity": [10, 2],
+    }
+    assert book.quantity_held("INFY") == 3
+    assert lots(book, "INFY") == [(120.0, 3)]
+    assert lots(book, "TCS") == [(3000.0, 2), (3200.0, 1)]
+
+
+def test_lifo_sell_consumes_newest_lots_first():
+    book = make_book()
+    records = book.sell("INFY", 7, 130.0, LIFO)
+    assert records["stock_pur_price"] == [120.0, 100.0]
+    assert records["quantity"] == [5, 2]
+    assert book.quantity_held("INFY") == 8
+    assert lots(book, "INFY") == [(100.0, 8)]
+
+
+def test_average_sell_books_one_record_at_average_cost():
+    book = make_book()
+    records = book.sell("INFY", 6, 130.0, AVERAGE)
+    average = (100.0 * 10 + 120.0 * 5) / 15
+    assert records["quantity"] == [6]
+    assert records["stock_pur_price"] == [pytest.approx(average)]
+    assert book.quantity_held("INFY") == 9
+    # The shares left carry the average cost too
+    assert all(price == pytest.approx(round(average, 2)) for price, _ in lots(book, "INFY"))
+    assert sum(qty for _, qty in lots(book, "INFY")) == 9
+
+
+def test_sold_records_feed_the_sold_portfolio():
+    book, sold = make_book(), SoldPortfolio()
+    sold.add(**book.sell("INFY", 12, 130.0, FIFO))
+    assert sold.totals()["booked_profit_loss"] == pytest.approx(10 * 30.0 + 2 * 10.0)
+
+
+def test_oversell_raises_and_changes_nothing():
+    book = make_book()
+    before = book.frame().copy()
+    with pytest.raises(ValueError):
+        book.sell("INFY", 16, 130.0, FIFO)
+    with pytest.raises(ValueError):
+        book.sell("INFY", 1, 130.0, "random")
+    pd.testing.assert_frame_equal(book.frame(), before)
+    assert book.quantity_held("INFY") == 15
+
+
+def test_selling_out_drops_the_ticker():
+    book = make_book()
+    book.sell("INFY", 15, 130.0, LIFO)
+    assert book.tickers() == ["TCS"]
+    assert book.quantity_held("INFY") == 0
+    assert book.reprice({"INFY": 200.0}) == 0
+
+
+def test_reprice_after_tombstone_matches_a_rebuilt_table():
+    book = make_book()
+    book.frame(), book.totals()
+    # Consumes the first INFY lot entirely, leaving a tombstoned row in the middle of the table
+    book.sell("INFY", 10, 130.0, FIFO)
+    assert book.reprice({"INFY": 150.0, "TCS": 3300.0}) == 3
+    assert lots(book, "INFY") == [(120.0, 5)]
+    assert list(book.frame()["stock_cur_price"]) == [3300.0, 150.0, 3300.0]
+    assert_same_book(book, rebuilt(book))
+
+
+def test_incremental_reprice_keeps_cached_totals_exact():
+    book = make_book()
+    book.frame(), book.totals()
+    book.reprice({"INFY": 111.11})
+    book.reprice({"TCS": 2999.99, "MISSING": 1.0})
+    assert_same_book(book, rebuilt(book))
+
+
+def test_remove_then_add_keeps_share_counts():
+    book = make_book()
+    book.remove("TCS")
+    book.add("TCS", 3050.0, 3100.0, 4)
+    assert book.quantity_held("TCS") == 4
+    assert lots(book, "TCS") == [(3050.0, 4)]
+    assert_same_book(book, rebuilt(book))
@@ -0,0 +1,119 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from holdings import AVERAGE, LIFO, Portfolio, SoldPortfolio
+from ledger import SNAPSHOT_FILE, Ledger, apply_event, import_legacy_csvs
+from prices import FilePriceProvider, PriceEngine
+
+
+def assert_same_tables(actual, expected):
+    for table, other in zip(actual, expected):
+        pd.testing.assert_frame_equal(table.frame().reset_index(drop=True), other.frame().reset_index(drop=True))
+
+
+def replayed(ledger):
+    """Tables rebuilt from every event in the log, ignoring any snapshot."""
+    current, sold = Portfolio(), SoldPortfolio()
+    for event in ledger.events():
+        apply_event(current, sold, event)
+    return current, sold
+
+
+def trade(ledger, current, sold, engine):
+    """A mix of every event type, with marks priced offline from a price file."""
+    ledger.record(current, sold, "add", stock_name="TCS", stock_pur_price=3000.0, stock_cur_price=3100.0, quantity=5)
+    ledger.record(current, sold, "add", stock_name="INFY", stock_pur_price=100.0, stock_cur_price=110.0, quantity=10)
+    ledger.record(current, sold, "add", stock_name="INFY", stock_pur_price=120.0, stock_cur_price=110.0, quantity=5)
+    ledger.record(current, sold, "sell", stock_name="INFY", quantity=12, stock_sold_price=130.0, method=LIFO)
+    ledger.record(current, sold, "reprice", prices=engine.get_prices(current.tickers()))
+    ledger.record(current, sold, "add", stock_name="SBIN", stock_pur_price=700.0, stock_cur_price=780.0, quantity=3)
+    ledger.record(current, sold, "sell", stock_name="TCS", quantity=2, stock_sold_price=3300.0, method=AVERAGE)
+    ledger.record(current, sold, "remove", portfolio="sold", stock_name="INFY")
+
+
+@pytest.fixture
+def engine(tmp_path):
+    path = tmp_path / "prices.json"
+    path.write_text(json.dumps({"TCS": 3250.5, "INFY": 101.25}))
+    return PriceEngine([FilePriceProvider(str(path))])
+
+
+def test_snapshot_plus_tail_round_trips_the_live_tables(tmp_path, engine):
+    ledger = Ledger(str(tmp_path), snapshot_every=3)
+    live = ledger.load()
+    trade(ledger, *live, engine)
+    # Eight events with a snapshot every three: the last snapshot covers six, two are left in the tail
+    assert ledger.snapshot_seq == 6
+    assert os.path.exists(tmp_path / SNAPSHOT_FILE)
+    assert live[0].frame().set_index("stock_name").loc["TCS", "stock_cur_price"] == 3250.5
+
+    loaded = Ledger(str(tmp_path)).load()
+    assert_same_tables(loaded, live)
+    assert_same_tables(replayed(ledger), live)
+
+
+def test_load_ignores_a_torn_final_line(tmp_path, engine):
+    ledger = Ledger(str(tmp_path), snapshot_every=100)
+    live = ledger.load()
+    trade(ledger, *live, engine)
+    with open(ledger.ledger_path, "ab") as f:
+        f.write(b'{"seq": 99, "type": "add", "stock_na')
+    assert_same_tables(Ledger(str(tmp_path)).load(), live)
+    # The next writer cuts the torn line before appending
+    ledger.record(*live, "reprice", prices={"SBIN": 800.0})
+    assert_same_tables(Ledger(str(tmp_path)).load(), live)
+
+
+def test_two_ledgers_writing_one_directory_see_each_others_events(tmp_path):
+    first, second = Ledger(str(tmp_path), snapshot_every=2), Ledger(str(tmp_path), snapshot_every=2)
+    first_tables, second_tables = first.load(), second.load()
+
+    first.record(*first_tables, "add", stock_name="TCS", stock_pur_price=3000.0, stock_cur_price=3100.0, quantity=5)
+    # The second writer catches up on TCS before recording its own trade
+    second.record(*second_tables, "add", stock_name="INFY", stock_pur_price=100.0, stock_cur_price=110.0, quantity=10)
+    assert second_tables[0].tickers() == ["TCS", "INFY"]
+
+    first.record(*first_tables, "sell", stock_name="TCS", quantity=5, stock_sold_price=3200.0)
+    assert first_tables[0].tickers() == ["INFY"]
+
+    # Selling shares the other writer already sold fails without reaching the log
+    with pytest.raises(ValueError):
+        second.record(*second_tables, "sell", stock_name="TCS", quantity=1, stock_sold_price=3200.0)
+    assert [event["seq"] for event in second.events()] == [1, 2, 3]
+    assert_same_tables(second_tables, first_tables)
+
+    second.record(*second_tables, "reprice", prices={"INFY": 105.0})
+    first.record(*first_tables, "add", stock_name="SBIN", stock_pur_price=700.0, stock_cur_price=780.0, quantity=3)
+    assert [event["seq"] for event in first.events()] == [1, 2, 3, 4, 5]
+    assert_same_tables(first_tables, replayed(first))
+    assert_same_tables(Ledger(str(tmp_path)).load(), first_tables)
+
+
+def test_recorded_prices_are_marked_with_their_time(tmp_path):
+    ledger = Ledger(str(tmp_path), snapshot_every=2)
+    tables = ledger.load()
+    ledger.record(*tables, "add", stock_name="TCS", stock_pur_price=3000.0, stock_cur_price=3100.0, quantity=5)
+    ledger.record(*tables, "reprice", prices={"TCS": 3150.0})
+    ledger.record(*tables, "add", stock_name="INFY", stock_pur_price=100.0, stock_cur_price=110.0, quantity=10)
+    assert set(ledger.marked) == {"TCS", "INFY"}
+    # Marks before the snapshot come from its metadata, later ones from the tail
+    reloaded = Ledger(str(tmp_path))
+    reloaded.load()
+    assert reloaded.marked == ledger.marked
+
+
+def test_legacy_csvs_are_imported_once(tmp_path):
+    (tmp_path / "current_portfolio.csv").write_text(
+        "stock_name,stock_pur_price,stock_cur_price,quantity\nTCS,3000,3100,5\nTotal,,,5\n")
+    ledger = Ledger(str(tmp_path))
+    assert import_legacy_csvs(ledger) == []
+    current, sold = ledger.load()
+    assert current.tickers() == ["TCS"] and sold.empty
+    ledger.record(current, sold, "reprice", prices={"TCS": 3200.0})
+    # Later edits to the CSV are not re-imported
+    (tmp_path / "current_portfolio.csv").write_text("stock_name,stock_pur_price,stock_cur_price,quantity\nINFY,1,1,1\n")
+    assert import_legacy_csvs(ledger) == []
+    assert Ledger(str(tmp_path)).load()[0].tickers() == ["TCS"]